@@ -0,0 +1,233 @@
+# analitica.py – volumen de entrenamiento del historial de planes, con agregados incrementales
+#
+# Cada semana guardada aporta filas (métrica, clave, valor): series por tipo_ejercicio, por
+# categoria y por patrón de movimiento (subcategoria), distribución de RPE y frecuencia de
+# ejercicios. Los agregados semanales (por lunes, sumando atletas) y mensuales se mantienen
+# materializados: al guardar o sustituir una semana se resta su aporte anterior y se suma el
+# nuevo, así que consultar no recorre el historial.
+#
+#   an = Analitica()                 # planes/.manifest/analitica.db
+#   an.instalar()                    # hook en storage: se actualiza en cada save_week
+#   an.sincronizar()                 # recoge semanas guardadas por otros procesos
+#   an.sincronizar_si_cambio()       # lo mismo, solo si el backend marca cambios (barato)
+#   an.mensual("series_tipo")        # DataFrame periodo / clave / valor
+from __future__ import annotations
+import math
+import os
+import sqlite3
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+import storage
+
+METRICAS = {
+    "series_tipo": "Series por tipo de ejercicio",
+    "series_categoria": "Series por categoría",
+    "series_patron": "Series por patrón de movimiento",
+    "rpe": "Distribución de RPE (ejercicios)",
+    "frecuencia": "Frecuencia de ejercicios",
+}
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS semanas (
+    label  TEXT PRIMARY KEY,
+    lunes  TEXT,                 -- YYYY-MM-DD (NULL si el label no empieza por fecha)
+    huella TEXT NOT NULL         -- versión de la semana ya contabilizada
+);
+CREATE TABLE IF NOT EXISTS aportes (
+    label   TEXT NOT NULL,
+    metrica TEXT NOT NULL,
+    clave   TEXT NOT NULL,
+    valor   REAL NOT NULL,
+    PRIMARY KEY (label, metrica, clave)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS semanal (
+    periodo TEXT NOT NULL, metrica TEXT NOT NULL, clave TEXT NOT NULL, valor REAL NOT NULL,
+    PRIMARY KEY (metrica, periodo, clave)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS mensual (
+    periodo TEXT NOT NULL, metrica TEXT NOT NULL, clave TEXT NOT NULL, valor REAL NOT NULL,
+    PRIMARY KEY (metrica, periodo, clave)
+) WITHOUT ROWID;
+"""
+
+def _lunes(label: str) -> Optional[str]:
+    try:
+        return datetime.strptime(label[:10], "%Y-%m-%d").date().isoformat()
+    except ValueError:
+        return None
+
+def _numero(v: Any) -> Optional[float]:
+    try:
+        x = float(v)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(x) or math.isinf(x) else x
+
+def _clave(v: Any) -> Optional[str]:
+    if v is None or (isinstance(v, float) and math.isnan(v)):
+        return None
+    s = str(v).strip()
+    return s if s and s.lower() not in ("nan", "none") else None
+
+def _items(plan: dict) -> Iterator[dict]:
+    for dia in plan.values():
+        if not storage._is_day(dia):
+            continue
+        for bloque in dia.get("bloques") or []:
+            items = bloque.get("items") if isinstance(bloque, dict) else None
+            if isinstance(items, list):
+                yield from (r for r in items if isinstance(r, dict))
+
+def aportes_semana(plan: dict) -> Dict[Tuple[str, str], float]:
+    """{(metrica, clave): valor} de un plan (json-safe, como lo devuelve storage.load_week)."""
+    out: Counter = Counter()
+    for r in _items(plan):
+        series = _numero(r.get("series"))
+        if series is not None:
+            for metrica, col in (("series_tipo", "tipo_ejercicio"), ("series_categoria", "categoria"),
+                                 ("series_patron", "subcategoria")):
+                clave = _clave(r.get(col))
+                if clave is not None:
+                    out[(metrica, clave)] += series
+        rpe = _numero(r.get("RPE", r.get("rpe")))
+        if rpe is not None:
+            out[("rpe", f"{rpe:g}")] += 1
+        ejercicio = _clave(r.get("ejercicio"))
+        if ejercicio is not None:
+            out[("frecuencia", ejercicio)] += 1
+    return dict(out)
+
+class Analitica:
+    """Agregados de volumen materializados en SQLite, actualizados semana a semana."""
+
+    def __init__(self, ruta: Optional[str] = None):
+        if ruta is None:
+            # junto al manifiesto: escribir aquí no altera el mtime de planes/
+            ruta = os.path.join(storage.BASE_DIR, ".manifest", "analitica.db")
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._marca: Optional[Tuple[int, Any]] = None   # (id del backend, backend.marca()) ya sincronizado
+        self._con = sqlite3.connect(ruta, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode = WAL")
+        self._con.execute("PRAGMA synchronous = NORMAL")   # datos derivados: sincronizar() los rehace
+        self._con.executescript(ESQUEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._con.close()
+
+    # ---------------- actualización incremental ----------------
+
+    def _sumar(self, cur: sqlite3.Cursor, label: str, signo: float, filas: List[Tuple[str, str, float]]) -> None:
+        lunes = cur.execute("SELECT lunes FROM semanas WHERE label = ?", (label,)).fetchone()
+        if not lunes or lunes[0] is None:
+            return
+        periodos = (("semanal", lunes[0]), ("mensual", lunes[0][:7]))
+        for tabla, periodo in periodos:
+            cur.executemany(
+                f"INSERT INTO {tabla} (periodo, metrica, clave, valor) VALUES (?, ?, ?, ?)"
+                f" ON CONFLICT (metrica, periodo, clave) DO UPDATE SET valor = valor + excluded.valor",
+                [(periodo, m, c, signo * v) for m, c, v in filas])
+            cur.executemany(f"DELETE FROM {tabla} WHERE metrica = ? AND periodo = ? AND clave = ? AND abs(valor) < 1e-9",
+                            [(m, periodo, c) for m, c, _ in filas])
+
+    def _quitar(self, cur: sqlite3.Cursor, label: str) -> None:
+        viejas = cur.execute("SELECT metrica, clave, valor FROM aportes WHERE label = ?", (label,)).fetchall()
+        self._sumar(cur, label, -1.0, viejas)
+        cur.execute("DELETE FROM aportes WHERE label = ?", (label,))
+        cur.execute("DELETE FROM semanas WHERE label = ?", (label,))
+
+    def actualizar(self, label: str, plan: dict, huella: str = "") -> None:
+        """Sustituye el aporte de la semana 'label' (firma de hook de storage.add_save_hook)."""
+        nuevas = [(m, c, v) for (m, c), v in aportes_semana(plan).items()]
+        with self._lock, self._con:
+            cur = self._con.cursor()
+            self._quitar(cur, label)
+            cur.execute("INSERT INTO semanas (label, lunes, huella) VALUES (?, ?, ?)", (label, _lunes(label), huella))
+            cur.executemany("INSERT INTO aportes (label, metrica, clave, valor) VALUES (?, ?, ?, ?)",
+                            [(label, m, c, v) for m, c, v in nuevas])
+            self._sumar(cur, label, 1.0, nuevas)
+
+    def eliminar(self, label: str) -> None:
+        with self._lock, self._con:
+            self._quitar(self._con.cursor(), label)
+
+    def instalar(self) -> "Analitica":
+        """Registra actualizar() como hook de guardado de storage."""
+        storage.add_save_hook(self.actualizar)
+        return self
+
+    def sincronizar(self, backend: Optional[storage.StorageBackend] = None) -> int:
+        """Pone los agregados al día con el backend; solo carga semanas nuevas o cambiadas.
+
+        Devuelve cuántas semanas se (re)contabilizaron.
+        """
+        backend = backend or storage.get_backend()
+        actuales = backend.fingerprints()
+        with self._lock:
+            vistas = dict(self._con.execute("SELECT label, huella FROM semanas").fetchall())
+        for label in vistas.keys() - actuales.keys():
+            self.eliminar(label)
+        cambiadas = [l for l, h in actuales.items() if vistas.get(l) != h]
+        for label in cambiadas:
+            try:
+                plan = backend.load_week(label)
+            except Exception:
+                plan = {}       # corrupta: cuenta como vacía hasta que se vuelva a guardar
+            self.actualizar(label, plan, actuales[label])
+        return len(cambiadas)
+
+    def sincronizar_si_cambio(self, backend: Optional[storage.StorageBackend] = None) -> int:
+        """sincronizar() la primera vez y después solo si cambia backend.marca().
+
+        Para llamarlo en cada rerun de la app: lo guardado desde este proceso ya llega por el
+        hook, así que normalmente cuesta un stat (o un PRAGMA) y no recorre el historial.
+        """
+        backend = backend or storage.get_backend()
+        marca = (id(backend), backend.marca())
+        if marca == self._marca:
+            return 0
+        n = self.sincronizar(backend)
+        self._marca = marca
+        return n
+
+    # ---------------- consultas ----------------
+
+    def _tabla(self, tabla: str, metrica: str, desde: Optional[str], hasta: Optional[str]) -> pd.DataFrame:
+        sql = f"SELECT periodo, clave, valor FROM {tabla} WHERE metrica = ?"
+        params: list = [metrica]
+        if desde is not None:
+            sql += " AND periodo >= ?"
+            params.append(desde)
+        if hasta is not None:
+            sql += " AND periodo <= ?"
+            params.append(hasta)
+        with self._lock:
+            filas = self._con.execute(sql + " ORDER BY periodo, clave", params).fetchall()
+        return pd.DataFrame(filas, columns=["periodo", "clave", "valor"])
+
+    def semanal(self, metrica: str, desde: Optional[str] = None, hasta: Optional[str] = None) -> pd.DataFrame:
+        """Agregado por semana (lunes YYYY-MM-DD, sumando todos los atletas)."""
+        return self._tabla("semanal", metrica, desde, hasta)
+
+    def mensual(self, metrica: str, desde: Optional[str] = None, hasta: Optional[str] = None) -> pd.DataFrame:
+        """Agregado por mes (YYYY-MM) según el lunes de cada semana."""
+        return self._tabla("mensual", metrica, desde, hasta)
+
+    def totales(self, metrica: str) -> pd.DataFrame:
+        """Total de todo el historial por clave (incluye labels sin fecha)."""
+        with self._lock:
+            filas = self._con.execute(
+                "SELECT clave, SUM(valor) AS valor FROM aportes WHERE metrica = ? GROUP BY clave"
+                " ORDER BY valor DESC", (metrica,)).fetchall()
+        return pd.DataFrame(filas, columns=["clave", "valor"])
+
+    def semanas(self) -> int:
+        with self._lock:
+            return self._con.execute("SELECT COUNT(*) FROM semanas").fetchone()[0]
@@ -1,13 +1,21 @@
+import os
+import re
 import streamlit as st
 import pandas as pd
 import streamlit.components.v1 as components
 from datetime import date, timedelta
-from patterns_bau import PATTERNS
-from planner import plan_semana
-from storage import save_week, load_week, list_weeks, label_from_date, ensure_autogen_today, week_monday
+from patterns_bau import PATTERNS_COMPILADOS as PATTERNS
+from planner import PlanSemana
+from catalogo import Catalogo, cargar_catalogo
+from reglas import diagnosticar, huella_patterns
+from analitica import Analitica, METRICAS
+from storage import (get_backend, label_from_date, ensure_autogen_today, week_monday,
+                     configure_write_behind, save_status)
 
 # --- Config ---
 st.set_page_config(layout="wide", page_title="Planificador Sesiones")
+configure_write_behind(True)   # guardar no bloquea la página: se escribe en segundo plano
+backend = get_backend()        # archivos en planes/ (por defecto) o SQLite con PLANES_BACKEND=sqlite
 
 # ---- CSS global (cards) ----
 st.markdown("""
@@ -53,64 +61,105 @@ hr.sep { border:0; border-top:1px dashed #273147; margin:10px 0; }
 @media (min-width: 760px){
   .card-title{ font-size:20px; }
 }
+@media (max-width: 640px){
+  .card { padding: 12px 12px 10px; margin: 8px 0 10px; border-radius: 12px; }
+  .card-title { font-size: 17px; }
+  .actions .btn { flex: 1 1 100%; }
+}
 </style>
 """, unsafe_allow_html=True)
 
 st.title("Planificador sesiones")
 
 # ---------- CARGA DE DATOS ----------
-def cargar_datos():
+# Cachés compartidas entre sesiones: el catálogo se recarga solo si cambia el Excel y el
+# plan solo se recalcula si cambian catálogo, PATTERNS o semana.
+CACHE_TTL_S = 3600
+CACHE_MAX_PLANES = 64
+
+@st.cache_resource(max_entries=4, ttl=CACHE_TTL_S, show_spinner=False)
+def _catalogo_compartido(nombre: str, firma: tuple) -> Catalogo:
+    # 'firma' (mtime, tamaño) forma parte de la clave: si el fichero cambia, se recarga
+    catalogo = cargar_catalogo(nombre)
+    print(f"Datos cargados desde **{nombre}**")
+    for aviso in catalogo.avisos:
+        print(f"[catálogo] {aviso}")
+
+    # Reglas de PATTERNS que nunca casan con este catálogo (siempre acabarían en _fallback)
+    for aviso in diagnosticar(catalogo, PATTERNS):
+        print(f"[PATTERNS] {aviso.dia} · {aviso.bloque} {aviso.lado}: {aviso.motivo}")
+
+    # Índice invertido del catálogo: se construye una vez por carga y lo reutiliza el planner
+    catalogo.indice
+    return catalogo
+
+def cargar_datos() -> Catalogo:
+    """Catálogo normalizado una sola vez (cabeceras, tipos, índice); el planner no vuelve a copiarlo.
+
+    Se lee de la caché binaria (.cache_catalogo/) salvo que el Excel haya cambiado."""
     posibles = ["datos_clasificado.xlsx"]
-    df = pd.DataFrame()
     for nombre in posibles:
         try:
-            df = pd.read_excel(nombre)
-            print(f"Datos cargados desde **{nombre}**")
-            break
+            info = os.stat(nombre)
         except FileNotFoundError:
             continue
+        return _catalogo_compartido(nombre, (info.st_mtime_ns, info.st_size))
 
-    if df.empty:
-        st.error("No encuentro ninguno de estos ficheros: datos_clasificado.xlsx")
-        return df
-
-    # Encabezados a minúscula simple
-    df.columns = [str(c).strip().lower() for c in df.columns]
-
-    # Renombres mínimos seguros
-    ren = {}
-    if "tipo ejercicio" in df.columns: ren["tipo ejercicio"] = "tipo_ejercicio"
-    if "categoría" in df.columns: ren["categoría"] = "categoria"
-    if "subcategoría" in df.columns: ren["subcategoría"] = "subcategoria"
-    if "sub-categoria" in df.columns: ren["sub-categoria"] = "subcategoria"
-    if ren:
-        df = df.rename(columns=ren)
+    st.error("No encuentro ninguno de estos ficheros: datos_clasificado.xlsx")
+    return Catalogo(pd.DataFrame())
 
-    # Tipos suaves
-    if 'prioridad' in df.columns:
-        df['prioridad'] = pd.to_numeric(df['prioridad'], errors='coerce')
-    for c in ['categoria','subcategoria','ejercicio','tipo_ejercicio','explicacion']:
-        if c in df.columns:
-            df[c] = df[c].astype(str)
+@st.cache_resource(max_entries=CACHE_MAX_PLANES, ttl=CACHE_TTL_S, show_spinner=False)
+def _plan_semana_compartido(huella_catalogo: str, huella_plantillas: str, semana: int, _catalogo: Catalogo) -> PlanSemana:
+    # los argumentos con '_' no entran en la clave: la identifican las dos huellas + semana.
+    # cache_resource (sin pickle): el plan perezoso compartido solo genera los días que se abren
+    return PlanSemana(_catalogo, PATTERNS, semana_mesociclo=semana)
 
-    return df
+def plan_semana_cacheado(catalogo: Catalogo, semana: int) -> PlanSemana:
+    return _plan_semana_compartido(catalogo.huella, huella_patterns(PATTERNS), semana, catalogo)
 
 # ---------- Cards (móvil) ----------
-def _val(v, default=""):
-    try:
-        if pd.isna(v): return default
-    except Exception:
-        pass
-    s = str(v).strip()
-    return default if s.lower() in ("nan", "none") else s
-
-def _norm_url(url: str) -> str:
-    if not url: return ""
-    s = str(url).strip()
-    if s.lower().startswith(("http://","https://")): return s
-    if any(dom in s.lower() for dom in ["youtube.com","youtu.be","vimeo.com","instagram.com","x.com","twitter.com","drive.google.com"]):
-        return "https://" + s
-    return ""
+# Las tarjetas de un bloque se montan por columnas (operaciones de texto de pandas) y se
+# envían en un único st.markdown: un mensaje al navegador por bloque, no uno por ejercicio.
+DOMINIOS_VIDEO = ["youtube.com","youtu.be","vimeo.com","instagram.com","x.com","twitter.com","drive.google.com"]
+_RE_DOMINIOS = "|".join(re.escape(d) for d in DOMINIOS_VIDEO)
+
+def _textos(df: pd.DataFrame, col: str) -> pd.Series:
+    """Columna como texto limpio: nulos, 'nan' y 'none' pasan a ''."""
+    if col not in df.columns:
+        return pd.Series("", index=df.index, dtype="str")
+    s = df[col].astype("str").str.strip().fillna("")
+    return s.mask(s.str.lower().isin(["nan", "none"]), "")
+
+def _norm_urls(urls: pd.Series) -> pd.Series:
+    low = urls.str.lower()
+    con_esquema = low.str.startswith(("http://", "https://"))
+    conocido = low.str.contains(_RE_DOMINIOS, regex=True)
+    return urls.where(con_esquema, ("https://" + urls).where(conocido, ""))
+
+def _si(cond: pd.Series, html: pd.Series) -> pd.Series:
+    return html.where(cond, "")
+
+def cards_html(df_items: pd.DataFrame) -> str:
+    titulo = _textos(df_items, "ejercicio")
+    series = _textos(df_items, "series")
+    reps   = _textos(df_items, "repeticiones")
+    tipo   = _textos(df_items, "tipo_ejercicio")
+    sup    = _textos(df_items, "superserie")
+    expl   = _textos(df_items, "explicacion")
+    video  = _norm_urls(_textos(df_items, "video"))
+
+    dosis = _si((series != "") | (reps != ""), series + " × " + reps)
+    header = ('<div class="card-header"><div class="badge gray">'
+              + ("SUPERSET " + sup).where(sup != "", "EJERCICIO")
+              + '</div><div class="badge primary">' + tipo.where(tipo != "", "Accesorio") + "</div></div>")
+    chips = _si(dosis != "", '<span class="chip">' + dosis + "</span>") + _si(tipo != "", '<span class="chip">' + tipo + "</span>")
+    meta = _si(chips != "", '<div class="meta">' + chips + "</div>")
+    body = _si(expl != "", '<div class="label">Explicación</div><p>' + expl + "</p>")
+    actions = _si(video != "", '<div class="actions"><a class="btn" href="' + video
+                  + '" target="_blank" rel="noopener">▶ Ver vídeo</a></div>')
+    cards = ('<div class="card">' + header + '<div class="card-title">' + titulo + "</div>"
+             + meta + body + actions + "</div>")
+    return "".join(cards.tolist())
 
 def render_items_cards(items):
     df_items = items if isinstance(items, pd.DataFrame) else pd.DataFrame(items)
@@ -119,49 +168,7 @@ def render_items_cards(items):
 
     if 'orden' in df_items.columns:
         df_items = df_items.sort_values(['superserie','orden'], ignore_index=True)
-    if 'RPE' in df_items.columns and 'rpe' not in df_items.columns:
-        df_items = df_items.rename(columns={'RPE':'rpe'})
-
-    for _, row in df_items.fillna("").iterrows():
-        titulo = _val(row.get("ejercicio",""))
-        series = _val(row.get("series",""))
-        reps   = _val(row.get("repeticiones",""))
-        rpe    = _val(row.get("rpe", row.get("RPE","")))
-        tipo   = _val(row.get("tipo_ejercicio",""))
-        sup    = _val(row.get("superserie",""))
-        expl   = _val(row.get("explicacion",""))
-        video  = _norm_url(row.get("video",""))
-
-        dosis = f"{series} × {reps}" if series or reps else ""
-
-        header = f"""
-        <div class="card-header">
-          <div class="badge gray">{'SUPERSET ' + sup if sup else 'EJERCICIO'}</div>
-          <div class="badge primary">{tipo or 'Accesorio'}</div>
-        </div>"""
-
-        chips = []
-        if dosis: chips.append(f"<span class=\"chip\">{dosis}</span>")
-        if tipo:   chips.append(f"<span class=\"chip\">{tipo}</span>")
-        meta = f"<div class=\"meta\">{''.join(chips)}</div>" if chips else ""
-
-        body = f"<div class=\"label\">Explicación</div><p>{expl}</p>" if expl else ""
-
-        btns = []
-        # print(video)
-        if video:
-            btns.append(f"<a class=\"btn\" href=\"{video}\" target=\"_blank\" rel=\"noopener\">▶ Ver vídeo</a>")
-        actions = f"<div class=\"actions\">{''.join(btns)}</div>" if btns else ""
-
-        card_html = f"""
-        <div class="card">
-          {header}
-          <div class="card-title">{titulo}</div>
-          {meta}
-          {body}
-          {actions}
-        </div>"""
-        st.markdown(card_html, unsafe_allow_html=True)
+    st.markdown(cards_html(df_items), unsafe_allow_html=True)
 
 def render_plan(plan: dict):
     if 'duracion_min' in plan:
@@ -172,8 +179,8 @@ def render_plan(plan: dict):
         st.info(str(plan))
 
 #  ---------- CARGA ----------
-df = cargar_datos()
-if df.empty:
+catalogo = cargar_datos()
+if catalogo.empty:
     st.stop()
 
 # ---------- CONTROLES ----------
@@ -187,52 +194,57 @@ with colC:
     label = label_from_date(base_date)
     st.text_input("Etiqueta (YYYY-MM-DD)", value=label, disabled=True)
 with colD:
-    created, autolabel = ensure_autogen_today(lambda: plan_semana(df, PATTERNS, semana_mesociclo=1))
+    created, autolabel = ensure_autogen_today(lambda: plan_semana_cacheado(catalogo, 1))
     if created:
         st.success(f"Generado y guardado automáticamente el plan de la semana {autolabel}.")
 
 # ---------- GENERAR / GUARDAR ----------
 if st.button("Generar plan y guardar"):
-    plan = plan_semana(df, PATTERNS, semana_mesociclo=semana)
-    path = save_week(plan, label)
+    plan = plan_semana_cacheado(catalogo, semana)
+    path = backend.save_week(plan, label)
     st.success(f"Plan guardado: {path}")
-
-# ---------- VISTA: semana actual (con fecha por día y expanders cerrados) ----------
+    estado = save_status(label)
+    if estado and estado["state"] != "saved":
+        st.caption("Escribiendo en disco en segundo plano…")
+estado = save_status(label)
+if estado and estado["state"] == "error":
+    st.error(f"No se pudo guardar {estado['path']}: {estado['error']}")
+
+# ---------- VISTA: semana actual (solo se pinta el día elegido) ----------
 st.markdown("---")
 st.markdown("Semana actual")
 
-plan_preview = plan_semana(df, PATTERNS, semana_mesociclo=semana)
+plan_preview = plan_semana_cacheado(catalogo, semana)
 dias = ["Lunes","Martes","Miércoles","Jueves","Viernes","Sábado","Domingo"]
 
-for i, d in enumerate(dias):
-    fecha = (base_date + timedelta(days=i)).strftime("%d-%m-%Y")
-    data = plan_preview[d]
-
-    # Expander de DÍA (cerrado por defecto)
-    tipo = (data.get("meta") or {}).get("titulo", "")
-    titulo_tipo = f" · {tipo}" if tipo else ""
-    with st.expander(f"📅 {d} · {fecha}{titulo_tipo}", expanded=False):
-    # with st.expander(f"📅 {d} · {fecha}", expanded=False):
-        bloques = data.get("bloques", [])
-        if not bloques:
-            st.info("Sin bloques para este día.")
-            continue
-
-        # Pestañas por bloque (sustituyen al expander anidado)
-        tabs = st.tabs([f"🔹 {b['tipo']}" for b in bloques])
-        for tab, bloque in zip(tabs, bloques):
-            with tab:
-                if "items" in bloque:
-                    render_items_cards(bloque["items"])
-                elif "plan" in bloque:
-                    render_plan(bloque["plan"])
+def _etiqueta_dia_semana(d):
+    fecha = (base_date + timedelta(days=dias.index(d))).strftime("%d-%m-%Y")
+    # el título sale de la plantilla, no de plan_preview[d] (eso generaría los 7 días)
+    tipo = ((PATTERNS[d].meta if d in PATTERNS else None) or {}).get("titulo", "")
+    return f"📅 {d} · {fecha}" + (f" · {tipo}" if tipo else "")
+
+# Un selector en lugar de siete expanders: los expanders cerrados también envían su contenido
+hoy = date.today()
+d = st.selectbox("Día", dias, index=hoy.weekday() if week_monday(hoy) == base_date else 0,
+                 format_func=_etiqueta_dia_semana, key="dia_semana")
+bloques = plan_preview[d].get("bloques", [])
+if not bloques:
+    st.info("Sin bloques para este día.")
+else:
+    # Pestañas por bloque
+    tabs = st.tabs([f"🔹 {b['tipo']}" for b in bloques])
+    for tab, bloque in zip(tabs, bloques):
+        with tab:
+            if "items" in bloque:
+                render_items_cards(bloque["items"])
+            elif "plan" in bloque:
+                render_plan(bloque["plan"])
 
 # ---------- HISTORIAL ----------
 st.markdown("### Historial de semanas")
-labels = list_weeks()
+labels = backend.list_weeks()
 if labels:
     sel = st.selectbox("Ver semana guardada", labels, index=0)
-    stored = load_week(sel)
 
     # 'sel' es el lunes de esa semana (YYYY-MM-DD)
     try:
@@ -241,28 +253,54 @@ if labels:
     except Exception:
         base_hist = week_monday(date.today())
 
-    if stored:
+    # Solo se decodifica el día elegido (en .planz la cabecera trae los títulos)
+    indice = backend.load_week_index(sel)
+    if indice:
         dias = ["Lunes","Martes","Miércoles","Jueves","Viernes","Sábado","Domingo"]
-        for i, d in enumerate(dias):
-            fecha = (base_hist + timedelta(days=i)).strftime("%d-%m-%Y")
-            
-            data = stored.get(d, {})
-            tipo = (data.get("meta") or {}).get("titulo", "")
-            titulo_tipo = f" · {tipo}" if tipo else ""
-            with st.expander(f"📅 {d} · {fecha}{titulo_tipo}", expanded=False):
-            # with st.expander(f"📅 {d} · {fecha}", expanded=False):
-                bloques = data.get("bloques", [])
-                if not bloques:
-                    st.info("Sin bloques para este día.")
-                    continue
-
-                tabs = st.tabs([f"🔹 {b['tipo']}" for b in bloques])
-                for tab, bloque in zip(tabs, bloques):
-                    with tab:
-                        if "items" in bloque and isinstance(bloque["items"], list) and bloque["items"]:
-                            df_items = pd.DataFrame(bloque["items"])
-                            render_items_cards(df_items)
-                        elif "plan" in bloque:
-                            render_plan(bloque["plan"])
+        def _etiqueta_dia(d):
+            fecha = (base_hist + timedelta(days=dias.index(d))).strftime("%d-%m-%Y")
+            tipo = indice.get(d, "")
+            return f"📅 {d} · {fecha}" + (f" · {tipo}" if tipo else "")
+        d = st.selectbox("Día", dias, format_func=_etiqueta_dia, key="dia_historial")
+        data = backend.load_day(sel, d)
+        bloques = data.get("bloques", [])
+        if not bloques:
+            st.info("Sin bloques para este día.")
+        else:
+            tabs = st.tabs([f"🔹 {b['tipo']}" for b in bloques])
+            for tab, bloque in zip(tabs, bloques):
+                with tab:
+                    if "items" in bloque and isinstance(bloque["items"], list) and bloque["items"]:
+                        df_items = pd.DataFrame(bloque["items"])
+                        render_items_cards(df_items)
+                    elif "plan" in bloque:
+                        render_plan(bloque["plan"])
 else:
-    st.info("Aún no hay semanas guardadas.")
\ No newline at end of file
+    st.info("Aún no hay semanas guardadas.")
+
+# ---------- VOLUMEN (analítica incremental del historial) ----------
+@st.cache_resource
+def _analitica() -> Analitica:
+    # una por proceso: el hook la actualiza en cada guardado, sin releer el historial
+    return Analitica().instalar()
+
+st.markdown("### Volumen de entrenamiento")
+analitica = _analitica()
+analitica.sincronizar_si_cambio(backend)   # guardados de otros procesos; los de aquí llegan por el hook
+if analitica.semanas() == 0:
+    st.info("Aún no hay semanas guardadas para analizar.")
+else:
+    colM, colP = st.columns([2,1])
+    with colM:
+        metrica = st.selectbox("Métrica", list(METRICAS), format_func=METRICAS.get)
+    with colP:
+        periodo = st.radio("Periodo", ["Semanal", "Mensual"], horizontal=True)
+    datos = analitica.semanal(metrica) if periodo == "Semanal" else analitica.mensual(metrica)
+    if datos.empty:
+        st.info("Sin datos para esta métrica.")
+    else:
+        top = datos.groupby("clave")["valor"].sum().nlargest(15).index
+        tabla = (datos[datos["clave"].isin(top)]
+                 .pivot_table(index="periodo", columns="clave", values="valor", aggfunc="sum", fill_value=0))
+        st.bar_chart(tabla)
+        st.dataframe(tabla)
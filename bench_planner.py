@@ -0,0 +1,125 @@
+# bench_planner.py – compara el filtro fila a fila (apply axis=1) con el filtro por máscaras
+#
+# Uso:  python bench_planner.py [--filas 100000] [--reglas 6] [--semilla 0]
+#
+# Genera un catálogo sintético con el vocabulario de PATTERNS, comprueba que ambos caminos
+# devuelven exactamente lo mismo y mide el coste medio por regla.
+from __future__ import annotations
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, List
+
+from catalogo import como_catalogo, mapa_columnas, norm_texto as _norm
+from patterns_bau import PATTERNS
+from planner import _filter
+
+TIPOS = ["Movilidad", "Compuesto", "Accesorio", "Aislamiento", "Core", "Pliometrico"]
+CATEGORIAS = ["MOVILIDAD", "CORE", "PIERNA", "EMPUJES", "TIRÓN", "GLUTEO", "PLYO", "SALUD HOMBRO", "ISQUIOSURALES"]
+
+def _reglas(patterns: Dict[str, Any]) -> List[Dict[str, Any]]:
+    out = []
+    for p in patterns.values():
+        for r in p.get("reglas", {}).values():
+            for par in r.get("parejas", []):
+                out.extend(par)
+            if "tipo_ejercicio" in r and "parejas" not in r:
+                out.append(r)
+    return out
+
+def catalogo_sintetico(n: int, semilla: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(semilla)
+    vocab = sorted({w for r in _reglas(PATTERNS) for p in r.get("patrones", []) for w in p.split()})
+    vocab += ["con", "banda", "kb", "unilateral", "isometrico", "movilidad", "activacion"]
+    vocab = np.array(vocab, dtype=object)
+    palabras = rng.choice(vocab, size=(n, 3))
+    return pd.DataFrame({
+        "id": np.arange(1, n + 1),
+        "ejercicio": [" ".join(w).capitalize() for w in palabras],
+        "categoria": rng.choice(CATEGORIAS, size=n),
+        "subcategoria": rng.choice(vocab, size=n),
+        "tipo_ejercicio": rng.choice(TIPOS, size=n),
+        "prioridad": rng.integers(1, 4, size=n),
+        "explicacion": "Texto de ejemplo",
+    })
+
+# Helpers fila a fila del filtro anterior (solo para la referencia del benchmark)
+
+def _match_patrones(row, patrones: List[str]) -> bool:
+    if not patrones:
+        return True
+    texto = " ".join([_norm(row.get('categoria')), _norm(row.get('subcategoria')), _norm(row.get('ejercicio'))])
+    pats = [p.lower() for p in patrones]
+    return any(p in texto for p in pats)
+
+def _match_tags(row, tags: List[str]) -> bool:
+    if not tags:
+        return True
+    texto = " ".join([_norm(row.get('categoria')), _norm(row.get('subcategoria')), _norm(row.get('ejercicio'))])
+    tgs = [t.lower() for t in tags]
+    return all(t in texto for t in tgs)
+
+def _match_tipo(row, tipo: str|None) -> bool:
+    if not tipo:
+        return True
+    return _norm(row.get('tipo_ejercicio')) == _norm(tipo)
+
+def _filter_por_filas(df: pd.DataFrame, regla: Dict[str, Any]) -> pd.DataFrame:
+    """Implementación de referencia anterior (apply fila a fila), para comparar."""
+    cand = df.copy()
+    ren = mapa_columnas(cand.columns)
+    if ren:
+        cand = cand.rename(columns=ren)
+    if "prioridad" in cand.columns:
+        cand["prioridad"] = pd.to_numeric(cand["prioridad"], errors="coerce")
+    if regla.get("tipo_ejercicio") and "tipo_ejercicio" in cand.columns:
+        cand = cand[cand.apply(lambda r: _match_tipo(r, regla["tipo_ejercicio"]), axis=1)]
+    if regla.get("patrones"):
+        cand = cand[cand.apply(lambda r: _match_patrones(r, regla["patrones"]), axis=1)]
+    if regla.get("tags_incluye"):
+        cand = cand[cand.apply(lambda r: _match_tags(r, regla["tags_incluye"]), axis=1)]
+    if regla.get("prioridad") is not None and "prioridad" in cand.columns:
+        cand = cand[cand["prioridad"] == int(regla["prioridad"])]
+    if cand.shape[1] == 0:
+        return pd.DataFrame()
+    return cand.drop_duplicates(subset=["ejercicio"])
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--filas", type=int, default=100_000)
+    ap.add_argument("--reglas", type=int, default=6, help="reglas a medir con el camino lento")
+    ap.add_argument("--semilla", type=int, default=0)
+    args = ap.parse_args()
+
+    df = catalogo_sintetico(args.filas, args.semilla)
+    reglas = _reglas(PATTERNS)
+    print(f"Catálogo sintético: {len(df)} filas · {len(reglas)} reglas en PATTERNS")
+
+    # el Catalogo se crea una vez (con un DataFrame suelto, cada llamada hashea su contenido)
+    t0 = time.perf_counter()
+    cat = como_catalogo(df)
+    cat.indice
+    print(f"Índice (una vez por catálogo): {time.perf_counter() - t0:.3f}s")
+
+    # Camino vectorizado: todas las reglas
+    t0 = time.perf_counter()
+    for r in reglas:
+        _filter(cat, r)
+    t_vec = (time.perf_counter() - t0) / len(reglas)
+
+    # Camino fila a fila: solo unas pocas reglas (es lento) + verificación de igualdad
+    muestra = reglas[: args.reglas]
+    t0 = time.perf_counter()
+    ref = [_filter_por_filas(df, r) for r in muestra]
+    t_filas = (time.perf_counter() - t0) / len(muestra)
+    for r, esperado in zip(muestra, ref):
+        obtenido = _filter(cat, r)
+        assert obtenido.equals(esperado) and list(obtenido.columns) == list(esperado.columns), r
+
+    print(f"Fila a fila : {t_filas * 1000:9.1f} ms/regla ({len(muestra)} reglas)")
+    print(f"Vectorizado : {t_vec * 1000:9.1f} ms/regla ({len(reglas)} reglas)")
+    print(f"Aceleración : x{t_filas / t_vec:.0f} (resultados idénticos)")
+
+if __name__ == "__main__":
+    main()
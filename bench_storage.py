@@ -0,0 +1,97 @@
+# bench_storage.py – compara la conversión json-safe fila a fila (to_dict) con la conversión por columnas
+#
+# Uso:  python bench_storage.py [--dias 7] [--bloques 6] [--items 400] [--repeticiones 5] [--semilla 0]
+#
+# Genera un plan sintético grande (bloques con items de todos los dtypes que produce el planner,
+# con NaN/Inf, Int64 y columnas object), comprueba que el JSON y el .planz resultantes son
+# idénticos byte a byte con los dos caminos y mide el coste medio por plan.
+from __future__ import annotations
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from typing import Any, Dict
+
+import storage
+from storage import _json_bytes, _planz_bytes, _to_json_safe
+
+DIAS = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
+
+def _items(n: int, rng: np.random.Generator, circuito: bool) -> pd.DataFrame:
+    texto = np.array(["Sentadilla", "Press banca", "Remo", "Plancha", "Zancada", None], dtype=object)
+    prioridad = rng.integers(1, 4, size=n).astype(float)
+    prioridad[rng.random(n) < 0.1] = np.nan
+    prioridad[rng.random(n) < 0.01] = np.inf
+    df = pd.DataFrame({
+        "id": np.arange(1, n + 1),
+        "ejercicio": pd.array(rng.choice(texto, size=n), dtype="str"),
+        "series": rng.integers(2, 6, size=n),
+        "repeticiones": pd.array(rng.choice(["8-12", "6-8", "30s"], size=n), dtype="str"),
+        "categoria": pd.array(rng.choice(texto, size=n), dtype="str"),
+        "prioridad": prioridad,
+        "RPE": rng.integers(6, 10, size=n),
+        "unilateral": rng.random(n) < 0.3,
+        "extra": pd.Series(rng.integers(0, 3, size=n), dtype=object).map(lambda v: np.int64(v) if v else "-"),
+    })
+    if circuito:
+        df["superserie"] = pd.array(rng.choice(["A1", "A2"], size=n), dtype="str")
+        df["orden"] = pd.array(np.arange(n), dtype="Int64")
+    return df
+
+def plan_sintetico(dias: int, bloques: int, items: int, semilla: int = 0) -> Dict[str, Any]:
+    rng = np.random.default_rng(semilla)
+    plan = {}
+    for d in range(dias):
+        nombre = DIAS[d % 7] + ("" if d < 7 else f" {d // 7 + 1}")
+        plan[nombre] = {
+            "meta": {"titulo": f"Día {d + 1}", "semana": np.int64(1), "carga": np.float64(0.75)},
+            "bloques": [{"tipo": f"bloque_{b}", "items": _items(items, rng, circuito=b % 3 == 2)}
+                        for b in range(bloques)],
+        }
+    return plan
+
+def _to_json_safe_filas(x: Any) -> Any:
+    """Implementación de referencia anterior (to_dict fila a fila), para comparar."""
+    if isinstance(x, pd.DataFrame):
+        return x.to_dict(orient="records")
+    if isinstance(x, dict):
+        return {str(k): _to_json_safe_filas(v) for k, v in x.items()}
+    if isinstance(x, (list, tuple, set)):
+        return [_to_json_safe_filas(v) for v in x]
+    return _to_json_safe(x)
+
+def _medir(fn, plan, repeticiones: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeticiones):
+        fn(plan)
+    return (time.perf_counter() - t0) / repeticiones
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dias", type=int, default=7)
+    ap.add_argument("--bloques", type=int, default=6)
+    ap.add_argument("--items", type=int, default=400, help="items por bloque")
+    ap.add_argument("--repeticiones", type=int, default=5)
+    ap.add_argument("--semilla", type=int, default=0)
+    args = ap.parse_args()
+
+    plan = plan_sintetico(args.dias, args.bloques, args.items, args.semilla)
+    filas = args.dias * args.bloques * args.items
+    print(f"Plan sintético: {args.dias} días · {args.bloques} bloques/día · {filas} items")
+
+    ref, nuevo = _to_json_safe_filas(plan), _to_json_safe(plan)
+    assert _json_bytes(nuevo) == _json_bytes(ref), "JSON distinto"
+    assert _planz_bytes(nuevo) == _planz_bytes(ref), ".planz distinto"
+
+    t_filas = _medir(_to_json_safe_filas, plan, args.repeticiones)
+    t_cols = _medir(_to_json_safe, plan, args.repeticiones)
+    t_json = _medir(lambda p: storage._serialize(p, "json"), plan, args.repeticiones)
+    t_planz = _medir(lambda p: storage._serialize(p, "planz"), plan, args.repeticiones)
+
+    print(f"Fila a fila (to_dict) : {t_filas * 1000:9.1f} ms/plan")
+    print(f"Por columnas          : {t_cols * 1000:9.1f} ms/plan")
+    print(f"Aceleración           : x{t_filas / t_cols:.1f} (JSON y .planz idénticos byte a byte)")
+    print(f"Serializar completo   : json {t_json * 1000:.1f} ms · planz {t_planz * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
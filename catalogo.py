@@ -0,0 +1,457 @@
+# catalogo.py – catálogo de ejercicios normalizado una vez + índice invertido
+from __future__ import annotations
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import weakref
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Union
+
+# Columnas de texto sobre las que buscan 'patrones' y 'tags_incluye' (mismo orden que el planner)
+COLUMNAS_TEXTO = ("categoria", "subcategoria", "ejercicio")
+
+def norm_texto(s) -> str:
+    if pd.isna(s):
+        return ""
+    return str(s).strip().lower()
+
+def mapa_columnas(columnas) -> Dict[str, str]:
+    """Renombres tolerantes (mayúsculas/acentos) hacia los nombres que espera el planner."""
+    rename_map = {}
+    for c in list(columnas):
+        cl = str(c).strip().lower()
+        if cl in ("ejercicio",):
+            rename_map[c] = "ejercicio"
+        elif cl in ("tipo_ejercicio", "tipo ejercicio"):
+            rename_map[c] = "tipo_ejercicio"
+        elif cl in ("categoria", "categoría"):
+            rename_map[c] = "categoria"
+        elif cl in ("subcategoria", "sub-categoria", "subcategoría"):
+            rename_map[c] = "subcategoria"
+        elif cl in ("prioridad",):
+            rename_map[c] = "prioridad"
+    return rename_map
+
+_VACIO = np.empty(0, dtype=np.int64)
+
+class IndiceCatalogo:
+    """Índice construido una vez por catálogo: token/subcadena -> posiciones de fila (ordenadas).
+
+    Las posiciones son enteras (0..n-1), válidas para df.iloc. Las búsquedas de subcadenas
+    se memoizan, así que cada patrón de PATTERNS se resuelve una sola vez por catálogo.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        ren = mapa_columnas(df.columns)
+        cols = {ren.get(c, c): c for c in df.columns}
+        self.n = len(df)
+        self.todas = np.arange(self.n, dtype=np.int64)
+
+        # Texto "categoria subcategoria ejercicio" normalizado por fila (una sola vez)
+        partes = []
+        for nombre in COLUMNAS_TEXTO:
+            if nombre in cols:
+                partes.append([norm_texto(v) for v in df[cols[nombre]].tolist()])
+            else:
+                partes.append([""] * self.n)
+        self.textos: List[str] = [" ".join(t) for t in zip(*partes)]
+
+        # token -> filas
+        postings: Dict[str, List[int]] = {}
+        for i, texto in enumerate(self.textos):
+            for tok in set(texto.split()):
+                postings.setdefault(tok, []).append(i)
+        self._tokens = {t: np.asarray(v, dtype=np.int64) for t, v in postings.items()}
+
+        # tipo_ejercicio normalizado -> filas
+        self.tiene_tipo = "tipo_ejercicio" in cols
+        self._tipos: Dict[str, np.ndarray] = {}
+        if self.tiene_tipo:
+            tipos = pd.Series([norm_texto(v) for v in df[cols["tipo_ejercicio"]].tolist()])
+            for valor, pos in tipos.groupby(tipos, sort=False).indices.items():
+                self._tipos[valor] = np.asarray(pos, dtype=np.int64)
+
+        # prioridad numérica (como hace _filter con to_numeric)
+        self.tiene_prioridad = "prioridad" in cols
+        self._prioridad = (
+            pd.to_numeric(df[cols["prioridad"]], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+            if self.tiene_prioridad else None
+        )
+
+        self._memo_sub: Dict[str, np.ndarray] = {}
+        self._memo_frag: Dict[str, np.ndarray] = {}
+        self._memo_prio: Dict[int, np.ndarray] = {}
+        self._memo_masc: Dict[tuple, np.ndarray] = {}
+
+    # ---- consultas ----
+    def filas_tipo(self, tipo: str) -> np.ndarray:
+        return self._tipos.get(norm_texto(tipo), _VACIO)
+
+    def filas_prioridad(self, valor: int) -> np.ndarray:
+        r = self._memo_prio.get(valor)
+        if r is None:
+            r = np.flatnonzero(self._prioridad == valor).astype(np.int64)
+            self._memo_prio[valor] = r
+        return r
+
+    def _filas_fragmento(self, frag: str) -> np.ndarray:
+        # Un fragmento sin espacios está en el texto sii está dentro de algún token
+        r = self._memo_frag.get(frag)
+        if r is None:
+            listas = [pos for tok, pos in self._tokens.items() if frag in tok]
+            r = np.unique(np.concatenate(listas)) if listas else _VACIO
+            self._memo_frag[frag] = r
+        return r
+
+    def filas_con(self, sub: str) -> np.ndarray:
+        """Filas cuyo texto normalizado contiene 'sub' (misma semántica que `sub in texto`)."""
+        r = self._memo_sub.get(sub)
+        if r is None:
+            frags = sub.split()
+            cand: Optional[np.ndarray] = None
+            for frag in frags:
+                pos = self._filas_fragmento(frag)
+                cand = pos if cand is None else np.intersect1d(cand, pos, assume_unique=True)
+            if cand is None:
+                cand = self.todas
+            if frags != [sub]:
+                # subcadena con espacios: los fragmentos solo acotan, se verifica el texto completo
+                cand = np.asarray([i for i in cand if sub in self.textos[i]], dtype=np.int64)
+            r = cand
+            self._memo_sub[sub] = r
+        return r
+
+    def filas_alguno(self, subs: List[str]) -> np.ndarray:
+        listas = [self.filas_con(s) for s in subs]
+        return np.unique(np.concatenate(listas)) if listas else _VACIO
+
+    def filas_todos(self, subs: List[str]) -> np.ndarray:
+        r = self.todas
+        for s in subs:
+            r = np.intersect1d(r, self.filas_con(s), assume_unique=True)
+        return r
+
+    # ---- máscaras booleanas (memoizadas; no modificar el array devuelto) ----
+    def _mascara(self, clave: tuple, filas) -> np.ndarray:
+        m = self._memo_masc.get(clave)
+        if m is None:
+            m = np.zeros(self.n, dtype=bool)
+            m[filas()] = True
+            self._memo_masc[clave] = m
+        return m
+
+    def mascara_tipo(self, tipo: str) -> np.ndarray:
+        t = norm_texto(tipo)
+        return self._mascara(("tipo", t), lambda: self._tipos.get(t, _VACIO))
+
+    def mascara_prioridad(self, valor: int) -> np.ndarray:
+        return self._mascara(("prio", valor), lambda: self.filas_prioridad(valor))
+
+    def mascara_con(self, sub: str) -> np.ndarray:
+        return self._mascara(("sub", sub), lambda: self.filas_con(sub))
+
+    def mascara_alguno(self, subs: List[str]) -> np.ndarray:
+        m = np.zeros(self.n, dtype=bool)
+        for s in subs:
+            m |= self.mascara_con(s)
+        return m
+
+    def mascara_todos(self, subs: List[str]) -> np.ndarray:
+        m = np.ones(self.n, dtype=bool)
+        for s in subs:
+            m &= self.mascara_con(s)
+        return m
+
+def huella_catalogo(df: pd.DataFrame) -> str:
+    """Hash del contenido del catálogo (columnas, tipos, índice y valores)."""
+    h = hashlib.sha1()
+    h.update(repr([(str(c), str(t)) for c, t in df.dtypes.items()]).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+# ---------------- Catálogo canónico ----------------
+# Columnas que el planner usa si existen (faltar alguna no rompe nada, pero se avisa)
+COLUMNAS_ESPERADAS = ("ejercicio", "tipo_ejercicio", "categoria", "subcategoria", "prioridad")
+COLUMNAS_STR = ("categoria", "subcategoria", "ejercicio", "tipo_ejercicio", "explicacion")
+# Forma compacta: categorías con pocos valores -> códigos; textos largos -> fuera del DF de trabajo
+COLUMNAS_CATEGORICAS = ("tipo_ejercicio", "categoria", "subcategoria")
+COLUMNAS_TEXTO_LARGO = ("explicacion", "video")
+
+def normalizar_esquema(df: pd.DataFrame) -> pd.DataFrame:
+    """Renombres tolerantes + 'prioridad' numérica. No copia si ya está normalizado."""
+    rename_map = mapa_columnas(df.columns)
+    rename_map = {k: v for k, v in rename_map.items() if k != v}
+    if rename_map:
+        df = df.rename(columns=rename_map)
+    if "prioridad" in df.columns and not pd.api.types.is_numeric_dtype(df["prioridad"]):
+        df = df.assign(prioridad=pd.to_numeric(df["prioridad"], errors="coerce"))
+    return df
+
+class Catalogo:
+    """Catálogo normalizado una sola vez, con su índice y su huella de contenido.
+
+    El planner trabaja sobre posiciones de fila (iloc) y solo copia las filas elegidas.
+    El DataFrame interno es de solo lectura por convenio: no modificarlo in situ. Es una copia
+    superficial del de entrada: con copy-on-write (pandas >= 3) modificar luego el DataFrame
+    original no cambia el catálogo, así que su índice y su huella siguen siendo válidos.
+    """
+
+    def __init__(self, df: pd.DataFrame, origen: Optional[str] = None):
+        df = normalizar_esquema(df).copy(deep=False)
+        if df.columns.duplicated().any():
+            dups = sorted({str(c) for c in df.columns[df.columns.duplicated()]})
+            raise ValueError(f"Columnas duplicadas en el catálogo tras normalizar: {dups}")
+        self.df = df
+        self.origen = origen
+        self.avisos = [f"falta la columna '{c}'" for c in COLUMNAS_ESPERADAS if c not in df.columns]
+        self.col_dedup = "ejercicio" if "ejercicio" in df.columns else (df.columns[0] if len(df.columns) else None)
+        self.compacto = False
+        self._textos: Optional[pd.DataFrame] = None   # columnas largas separadas (forma compacta)
+        self._columnas = list(df.columns)              # orden/tipos originales para materializar
+        self._dtypes = df.dtypes.to_dict()
+        self._cols_planas: Optional[list] = None
+        self._indice: Optional[IndiceCatalogo] = None
+        self._huella: Optional[str] = None
+
+    @property
+    def indice(self) -> IndiceCatalogo:
+        if self._indice is None:
+            self._indice = IndiceCatalogo(self.df)
+        return self._indice
+
+    @property
+    def huella(self) -> str:
+        if self._huella is None:
+            self._huella = huella_catalogo(self.df)
+        return self._huella
+
+    @property
+    def columnas(self) -> List[str]:
+        """Columnas (en orden) de las filas materializadas por Catalogo.filas."""
+        return self._columnas
+
+    @property
+    def empty(self) -> bool:
+        return self.df.empty
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    def filas(self, pos) -> pd.DataFrame:
+        """Copia solo de las filas pedidas (posiciones iloc), con columnas y tipos originales."""
+        if not self.compacto:
+            return self.df.take(pos)
+        pos = np.asarray(pos, dtype=np.int64)
+        index = self.df.index.take(pos)
+        datos = {}
+        for c, valores, categorias, dtype in self._planas():
+            if categorias is None:
+                v = valores.take(pos)
+            else:
+                # decodifica solo las filas pedidas (no toda la columna)
+                codigos = valores[pos]
+                v = categorias[codigos]
+                v[codigos < 0] = np.nan
+            # Series con el dtype guardado: un array sin dtype explícito (p. ej. object) lo
+            # volvería a inferir el constructor del DataFrame ("str" en pandas >= 3)
+            datos[c] = pd.Series(v, index=index, dtype=dtype, copy=False)
+        return pd.DataFrame(datos, index=index, copy=False)
+
+    def _planas(self) -> list:
+        """(columna, valores o códigos, categorías o None, dtype original), en el orden original."""
+        if self._cols_planas is None:
+            planas = []
+            for c in self._columnas:
+                s = self.df[c] if c in self.df.columns else self._textos[c]
+                dtype = self._dtypes[c]
+                if isinstance(s.dtype, pd.CategoricalDtype):
+                    planas.append((c, s.cat.codes.to_numpy(), s.cat.categories.to_numpy(dtype=object), dtype))
+                else:
+                    planas.append((c, s.array, None, dtype))
+            self._cols_planas = planas
+        return self._cols_planas
+
+    def __getstate__(self):
+        estado = dict(self.__dict__)
+        estado["_cols_planas"] = None   # vistas derivadas: se recalculan al usarse
+        return estado
+
+    def compactar(self) -> "Catalogo":
+        """Versión compacta del catálogo (mismo contenido, misma huella, mismos resultados).
+
+        - tipo_ejercicio/categoria/subcategoria -> category (códigos enteros)
+        - prioridad -> Int8 si cabe
+        - explicacion/video -> DF aparte (category: textos repetidos una sola vez), que solo
+          se une a las filas elegidas al materializar (Catalogo.filas); salvo si es col_dedup
+        """
+        if self.compacto:
+            return self
+        df = self.df
+        cambios = {c: df[c].astype("category") for c in COLUMNAS_CATEGORICAS if c in df.columns}
+        if "prioridad" in df.columns:
+            prio = df["prioridad"]
+            enteros = prio.dropna()
+            if len(enteros) and (enteros == enteros.round()).all() and enteros.between(-128, 127).all():
+                cambios["prioridad"] = prio.astype("Int8")
+        # la columna de deduplicado se lee del DF de trabajo: se queda en él aunque sea larga
+        largas = [c for c in COLUMNAS_TEXTO_LARGO if c in df.columns and c != self.col_dedup]
+
+        nuevo = Catalogo.__new__(Catalogo)
+        nuevo.__dict__.update(self.__dict__)
+        nuevo.df = df.assign(**cambios).drop(columns=largas)
+        nuevo._textos = df[largas].astype("category") if largas else None
+        nuevo.compacto = True
+        nuevo._huella = self.huella     # la huella es la del contenido, no la de la representación
+        nuevo._cols_planas = None
+        nuevo._indice = None            # se reconstruye sobre el DF compacto (mismas posiciones)
+        return nuevo
+
+    def memoria(self) -> int:
+        """Bytes ocupados por los datos del catálogo (DF de trabajo + textos separados)."""
+        total = int(self.df.memory_usage(deep=True).sum())
+        if self._textos is not None:
+            total += int(self._textos.memory_usage(deep=True).sum())
+        return total
+
+# ---------------- Memo por DataFrame ----------------
+# Para llamadas con un DataFrame suelto: se indexa por id(df) con weakref para no retener
+# catálogos ya descartados, pero solo se reutiliza si el hash del contenido sigue siendo el
+# mismo (un DataFrame modificado in situ se vuelve a normalizar e indexar). Hashear cuesta
+# poco comparado con indexar; quien llama muchas veces debería pasar un Catalogo.
+_POR_DF: Dict[int, tuple] = {}
+
+def como_catalogo(df: Union[pd.DataFrame, Catalogo]) -> Catalogo:
+    """Catalogo de un DataFrame, memoizado por objeto y contenido (se normaliza una vez)."""
+    if isinstance(df, Catalogo):
+        return df
+    key = id(df)
+    huella = huella_catalogo(df)
+    entrada = _POR_DF.get(key)
+    if entrada is not None:
+        ref, huella_ant, cat = entrada
+        if ref() is df and huella_ant == huella:
+            return cat
+    cat = Catalogo(df)
+    if cat.df.dtypes.to_dict() == df.dtypes.to_dict() and cat.df.columns.equals(df.columns):
+        cat._huella = huella    # la normalización no cambió nada: mismo contenido, misma huella
+    _POR_DF[key] = (weakref.ref(df, lambda _r, k=key: _POR_DF.pop(k, None)), huella, cat)
+    return cat
+
+def indice_de(df: Union[pd.DataFrame, Catalogo]) -> IndiceCatalogo:
+    return como_catalogo(df).indice
+
+def huella_de(df: Union[pd.DataFrame, Catalogo]) -> str:
+    return como_catalogo(df).huella
+
+def invalidar_indice(df: pd.DataFrame) -> None:
+    _POR_DF.pop(id(df), None)
+
+def leer_catalogo(ruta: str, compacto: bool = True) -> Catalogo:
+    """Lee el Excel clasificado y aplica la normalización de la app (cabeceras, textos como str)."""
+    df = pd.read_excel(ruta)
+
+    # Encabezados a minúscula simple
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    df = normalizar_esquema(df)
+
+    # Tipos suaves
+    for c in COLUMNAS_STR:
+        if c in df.columns:
+            df[c] = df[c].astype(str)
+    cat = Catalogo(df, origen=ruta)
+    return cat.compactar() if compacto else cat
+
+# ---------------- Caché binaria en disco ----------------
+# El Excel se parsea solo cuando cambia: se guarda el catálogo normalizado (y su índice)
+# en pickle, junto a un .meta.json con mtime/tamaño/sha256 del fichero fuente.
+DIR_CACHE = os.path.join(os.getcwd(), ".cache_catalogo")
+_VERSION_CACHE = 3  # subir si cambia la normalización, Catalogo o IndiceCatalogo
+
+def _sha256_fichero(ruta: str) -> str:
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+def _rutas_cache(ruta: str) -> tuple:
+    # la clave es la ruta absoluta (hasheada): dos catálogos con el mismo nombre en carpetas
+    # distintas no comparten caché; el nombre se conserva solo para reconocer los archivos
+    absoluta = os.path.abspath(ruta)
+    clave = hashlib.sha1(absoluta.encode("utf-8")).hexdigest()[:16]
+    base = os.path.join(DIR_CACHE, f"{os.path.basename(absoluta)}.{clave}")
+    return f"{base}.pkl", f"{base}.meta.json"
+
+def _escribir_atomico(ruta: str, datos: bytes) -> None:
+    # temporal único: dos procesos que cargan a la vez el mismo catálogo no se lo pisan
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(ruta), prefix=f".{os.path.basename(ruta)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(datos)
+        os.replace(tmp, ruta)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+def _guardar_meta(ruta_meta: str, meta: dict) -> None:
+    try:
+        _escribir_atomico(ruta_meta, json.dumps(meta).encode("utf-8"))
+    except OSError:
+        pass
+
+def _leer_pickle(ruta_pkl: str, ruta: str) -> Optional[Catalogo]:
+    try:
+        with open(ruta_pkl, "rb") as f:
+            cat = pickle.load(f)
+    except Exception:
+        return None  # caché corrupta o de otra versión de pandas: se regenera
+    if not isinstance(cat, Catalogo):
+        return None
+    cat.origen = ruta
+    return cat
+
+def cargar_catalogo(ruta: str, usar_cache: bool = True) -> Catalogo:
+    """Como leer_catalogo (forma compacta), pero usando la caché binaria si el Excel no ha cambiado."""
+    st = os.stat(ruta)  # FileNotFoundError si no existe, igual que read_excel
+    if not usar_cache:
+        return leer_catalogo(ruta)
+    ruta_pkl, ruta_meta = _rutas_cache(ruta)
+    firma = {"version": _VERSION_CACHE, "ruta": os.path.abspath(ruta), "mtime_ns": st.st_mtime_ns,
+             "size": st.st_size}
+
+    meta = None
+    try:
+        with open(ruta_meta, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    sha = None
+    if meta and meta.get("version") == _VERSION_CACHE and meta.get("ruta") == os.path.abspath(ruta):
+        vigente = meta.get("mtime_ns") == st.st_mtime_ns and meta.get("size") == st.st_size
+        if not vigente:
+            # mtime distinto (copia, checkout…): si el contenido es el mismo, la caché vale
+            sha = _sha256_fichero(ruta)
+            vigente = meta.get("sha256") == sha
+        if vigente:
+            cat = _leer_pickle(ruta_pkl, ruta)
+            if cat is not None:
+                if meta.get("mtime_ns") != st.st_mtime_ns:
+                    _guardar_meta(ruta_meta, {**meta, **firma})
+                return cat
+
+    cat = leer_catalogo(ruta)
+    try:
+        os.makedirs(DIR_CACHE, exist_ok=True)
+        cat.indice, cat.huella  # se guardan ya calculados
+        _escribir_atomico(ruta_pkl, pickle.dumps(cat, protocol=pickle.HIGHEST_PROTOCOL))
+        _guardar_meta(ruta_meta, {**firma, "sha256": sha or _sha256_fichero(ruta)})
+    except OSError:
+        pass  # sin permisos de escritura: seguimos sin caché
+    return cat
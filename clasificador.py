@@ -1,3 +1,22 @@
+# clasificador.py – clasifica el catálogo de ejercicios (tipo_ejercicio / prioridad) por palabras clave
+#
+# Uso:  python clasificador.py                 datos.xlsx -> datos_clasificado.xlsx (incremental)
+#       python clasificador.py --completo      reclasifica todo y reescribe la salida desde cero
+#       python clasificador.py --entrada proveedor.csv --salida proveedor_clasificado.csv --streaming
+#
+# Como librería (importar no lee ni escribe nada): clasificar_columna / clasificar_df en memoria,
+# clasificar_catalogo (incremental entre archivos) y clasificar_archivo (por bloques, en un pool
+# de procesos y escribiendo según salen: memoria acotada para catálogos grandes).
+import argparse
+import hashlib
+import json
+import math
+import multiprocessing as mp
+import os
+import sys
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 
 # --- CONFIGURACIÓN DE PALABRAS CLAVE ---
@@ -24,29 +43,479 @@ def clasificar_ejercicio(nombre_ejercicio):
         # Aquí podrías añadir más lógica para 'Movilidad', 'Core', etc. si quieres
         return 'Accesorio', 2
 
-# --- SCRIPT PRINCIPAL ---
+# --- MOTOR VECTORIZADO ---
+# Cada lista de palabras se compila en una sola expresión regular (alternativa de literales,
+# equivalente a 'palabra in nombre') que se evalúa sobre toda la columna de una vez (con
+# pyarrow, en el motor de expresiones de Arrow). La precedencia es la de clasificar_ejercicio:
+# una fila se queda con la primera regla que casa.
+
+def reglas_clasificacion():
+    """(tipo, prioridad, palabras) en orden de precedencia; se leen las listas actuales."""
+    return [
+        ('Pliometrico', 1, PALABRAS_PLIOMETRICO),
+        ('Compuesto', 1, PALABRAS_COMPUESTO),
+        ('Aislamiento', 3, PALABRAS_AISLAMIENTO),
+    ]
+
+POR_DEFECTO = ('Accesorio', 2)
+
+_ESPECIALES = set(r".^$*+?()[]{}|\/-#&~")
+
+def _literal(palabra):
+    # escapa solo la puntuación especial: válido igual en 're' y en RE2 (Arrow)
+    return "".join("\\" + c if c in _ESPECIALES else c for c in palabra)
+
+def regex_palabras(palabras):
+    """Alternativa de las palabras como literales; None si la lista está vacía (nunca casa)."""
+    # las más largas primero: la búsqueda se queda con la primera alternativa que casa
+    orden = sorted(set(palabras), key=len, reverse=True)
+    return "|".join(_literal(p) for p in orden) if orden else None
+
+def clasificar_columna(nombres, reglas=None):
+    """Versión vectorizada de clasificar_ejercicio para una columna entera.
+
+    Devuelve (tipos, prioridades) como arrays numpy alineados con 'nombres', con exactamente
+    el mismo resultado que aplicar clasificar_ejercicio fila a fila. 'reglas' por defecto es
+    reglas_clasificacion().
+    """
+    # str() + lower() de Python, igual que la versión por fila (NaN -> 'nan', etc.)
+    valores = nombres.to_numpy(dtype=object) if isinstance(nombres, pd.Series) else nombres
+    texto = pd.Series([str(x).lower() for x in valores], dtype="str")
+    condiciones, tipos, prioridades = [], [], []
+    for tipo, prioridad, palabras in (reglas if reglas is not None else reglas_clasificacion()):
+        patron = regex_palabras(palabras)
+        if patron is None:
+            continue
+        condiciones.append(texto.str.contains(patron, regex=True).to_numpy(dtype=bool))
+        tipos.append(tipo)
+        prioridades.append(prioridad)
+    if not condiciones:
+        return np.full(len(texto), POR_DEFECTO[0], dtype=object), np.full(len(texto), POR_DEFECTO[1], dtype=np.int64)
+    # np.select se queda con la primera condición cierta: misma precedencia que los if/elif
+    return (np.select(condiciones, tipos, POR_DEFECTO[0]).astype(object),
+            np.select(condiciones, prioridades, POR_DEFECTO[1]).astype(np.int64))
+
+def clasificar_df(df, columna='ejercicio', reglas=None):
+    """Copia de df con tipo_ejercicio y prioridad calculados a partir de 'columna'."""
+    tipos, prioridades = clasificar_columna(df[columna], reglas)
+    return df.assign(tipo_ejercicio=tipos.tolist(), prioridad=prioridades.tolist())
+
+# --- MODO INCREMENTAL ---
+# Junto a la salida se guarda un sidecar (<salida>.hashes.json) con, por fila: el hash de los
+# campos que mira el clasificador y el tipo/prioridad que dio. Al volver a clasificar solo se
+# recalculan las filas nuevas o cuyo ejercicio ha cambiado; si en la salida el tipo/prioridad no
+# coincide con lo que dio el clasificador, es una corrección a mano y se respeta. El resto de
+# columnas sale de la entrada.
+#
+# Clave de cada fila (se decide fila a fila, así que un ID repetido o vacío solo afecta a esas
+# filas): "id:<ID>" si su ID está y es único; si no, "ej:<nombre>#<nº de aparición del nombre>".
+# Las filas de la entrada se emparejan con las de la salida anterior primero por esa clave y
+# luego por nombre + aparición (lo que casa filas que cambiaron de esquema entre ejecuciones).
+
+CAMPOS_CLASIFICACION = ['ejercicio']   # campos de la fila que usa clasificar_ejercicio
+COLUMNAS_RESULTADO = ['tipo_ejercicio', 'prioridad']
+VERSION_SIDECAR = 2                    # 1: todas las claves id: o todas ej: (se sigue leyendo)
+ESQUEMA_CLAVES = "id-o-ejercicio"
+MIN_COINCIDENCIA = 0.5                 # por debajo, la salida anterior no parece de esta entrada
+
+def ruta_sidecar(ruta_salida):
+    return f"{ruta_salida}.hashes.json"
+
+def _columna(df, nombre):
+    """Columna de df cuyo nombre normalizado es 'nombre' (None si no hay)."""
+    for c in df.columns:
+        if str(c).strip().lower() == nombre:
+            return c
+    return None
+
+def _claves_ejercicio(df):
+    vistos = Counter()
+    claves = []
+    for v in df[_columna(df, 'ejercicio')].tolist():
+        nombre = str(v).strip().lower()
+        claves.append(f"ej:{nombre}#{vistos[nombre]}")
+        vistos[nombre] += 1
+    return claves
+
+def _claves_id(df):
+    """'id:<ID>' por fila, o None si el ID falta o está repetido."""
+    col_id = _columna(df, 'id')
+    if col_id is None:
+        return [None] * len(df)
+    ids = df[col_id]
+    validos = (ids.notna() & ~ids.duplicated(keep=False)).tolist()
+    return [f"id:{v}" if ok else None for v, ok in zip(ids.tolist(), validos)]
+
+def claves_filas(df):
+    """Clave estable por fila: el ID si está y es único; si no, nombre + nº de aparición."""
+    return [i or e for i, e in zip(_claves_id(df), _claves_ejercicio(df))]
+
+def hashes_filas(df):
+    """Hash (hex) de los campos de CAMPOS_CLASIFICACION de cada fila, tal como los ve el clasificador."""
+    datos = pd.DataFrame({c: [str(v) for v in df[_columna(df, c)].tolist()] for c in CAMPOS_CLASIFICACION},
+                         dtype=object)
+    return [format(h, "016x") for h in pd.util.hash_pandas_object(datos, index=False).tolist()]
+
+def firma_reglas():
+    """Cambia si cambian las listas de palabras o la precedencia: entonces se reclasifica todo."""
+    reglas = [[t, p, list(ps)] for t, p, ps in reglas_clasificacion()] + [list(POR_DEFECTO)]
+    return hashlib.sha1(json.dumps(reglas, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def _resultado(tipo, prioridad):
+    # valores de la salida comparables con los del sidecar (lo leído de Excel puede venir como float)
+    if tipo is None or (isinstance(tipo, float) and math.isnan(tipo)):
+        tipo = None
+    else:
+        tipo = str(tipo)
+    try:
+        prioridad = int(prioridad) if float(prioridad) == int(prioridad) else prioridad
+    except (TypeError, ValueError, OverflowError):
+        prioridad = None
+    return tipo, prioridad
+
+def _mapa_columnas(entrada, salida):
+    """{columna de entrada: columna de salida}. Por nombre (exacto o normalizado) y, si la salida
+    renombró cabeceras, por posición (la salida empieza con las columnas de la entrada)."""
+    libres = [c for c in salida.columns if str(c).strip().lower() not in COLUMNAS_RESULTADO]
+    mapa = {}
+    for c in entrada.columns:
+        if c in libres:
+            mapa[c] = c
+        else:
+            igual = _columna(salida[libres], str(c).strip().lower()) if libres else None
+            if igual is not None:
+                mapa[c] = igual
+    for i, c in enumerate(entrada.columns):
+        if c not in mapa and i < len(salida.columns):
+            candidata = salida.columns[i]
+            if candidata in libres and candidata not in mapa.values():
+                mapa[c] = candidata
+    return mapa
+
+def leer_sidecar(ruta_salida):
+    try:
+        with open(ruta_sidecar(ruta_salida), "r", encoding="utf-8") as f:
+            sidecar = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return sidecar if isinstance(sidecar, dict) and sidecar.get("version") in (1, VERSION_SIDECAR) else None
+
+def guardar_sidecar(ruta_salida, sidecar):
+    ruta = ruta_sidecar(ruta_salida)
+    tmp = f"{ruta}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(sidecar, f, ensure_ascii=False)
+    os.replace(tmp, ruta)
+
+def _sidecar_desde_salida(previa):
+    """Entradas de sidecar para una salida que no lo tiene: lo que daría el clasificador con sus
+    ejercicios. Así, lo que en la salida no coincida con eso cuenta como corrección a mano."""
+    tipos, prioridades = clasificar_columna(previa[_columna(previa, 'ejercicio')])
+    return [[h, t, int(p)] for h, t, p in zip(hashes_filas(previa), tipos.tolist(), prioridades.tolist())]
+
+def _emparejar(entrada, previa):
+    """Posición en 'previa' de cada fila de 'entrada' (None si es nueva), uno a uno.
+
+    Primero por claves_filas y después, para lo que quede, por nombre + aparición (salvo que
+    las dos filas tengan ID válido: entonces son filas distintas).
+    """
+    ids_e, ids_p = _claves_id(entrada), _claves_id(previa)
+    posiciones = [None] * len(entrada)
+    usadas = set()
+    pasadas = ((claves_filas(entrada), claves_filas(previa), False),
+               (_claves_ejercicio(entrada), _claves_ejercicio(previa), True))
+    for claves_e, claves_p, por_nombre in pasadas:
+        indice = {}
+        for j, k in enumerate(claves_p):
+            indice.setdefault(k, j)
+        for i, k in enumerate(claves_e):
+            j = indice.get(k) if posiciones[i] is None else None
+            if j is None or j in usadas or (por_nombre and ids_e[i] and ids_p[j]):
+                continue
+            posiciones[i] = j
+            usadas.add(j)
+    return posiciones
+
+def clasificar_incremental(entrada, previa=None, sidecar=None, forzar=False):
+    """Clasifica 'entrada' reutilizando la salida anterior ('previa') donde se pueda.
+
+    Devuelve (salida, sidecar, resumen). Sin 'previa' es una clasificación completa con las
+    columnas de la entrada + tipo_ejercicio/prioridad. Con 'previa', la salida conserva sus
+    cabeceras y columnas extra, las filas siguen el orden de la entrada y:
+      - tipo/prioridad corregidos a mano en 'previa' se mantienen,
+      - las filas sin cambios en CAMPOS_CLASIFICACION reutilizan su resultado,
+      - las nuevas o cambiadas (o todas, si cambiaron las reglas) se clasifican.
+    Si menos de MIN_COINCIDENCIA de las filas casan con 'previa' lanza ValueError (se perderían
+    las correcciones), salvo con forzar=True.
+    """
+    claves, hashes, firma = claves_filas(entrada), hashes_filas(entrada), firma_reglas()
+    resumen = Counter()
+
+    if previa is None:
+        salida = entrada.copy()
+        col_tipo, col_prio = COLUMNAS_RESULTADO
+        posiciones = [None] * len(claves)
+    else:
+        posiciones = _emparejar(entrada, previa)
+        casadas = sum(p is not None for p in posiciones)
+        minimo = min(len(entrada), len(previa))
+        if minimo and casadas < MIN_COINCIDENCIA * minimo and not forzar:
+            raise ValueError(f"solo {casadas} de {len(previa)} filas de la salida anterior casan con la "
+                             "entrada: ¿es otro catálogo o cambiaron los ID? Reclasifica desde cero "
+                             "(completo) o fuerza el modo incremental si es lo esperado.")
+        filas_sc = (sidecar or {}).get("filas", {})
+        mismas_reglas = sidecar is not None and sidecar.get("reglas") == firma
+        claves_prev = list(zip(claves_filas(previa), _claves_id(previa), _claves_ejercicio(previa)))
+        respaldo = None     # lo que daría el clasificador con la salida anterior (sin sidecar)
+        col_tipo = _columna(previa, 'tipo_ejercicio') or 'tipo_ejercicio'
+        col_prio = _columna(previa, 'prioridad') or 'prioridad'
+        # columnas de la salida anterior: las de entrada se rellenan desde la entrada,
+        # las extra (añadidas a mano) se conservan por fila emparejada
+        mapa = _mapa_columnas(entrada, previa)
+        desde_entrada = {v: k for k, v in mapa.items()}
+        columnas = {}
+        for c in previa.columns:
+            if c in desde_entrada:
+                columnas[c] = entrada[desde_entrada[c]].reset_index(drop=True)
+            elif c not in (col_tipo, col_prio):
+                valores = previa[c].tolist()
+                columnas[c] = pd.Series([valores[p] if p is not None else None for p in posiciones])
+        for c in entrada.columns:
+            if c not in mapa:    # columna nueva en la entrada
+                columnas[c] = entrada[c].reset_index(drop=True)
+        salida = pd.DataFrame(columnas)
+        resumen["eliminadas"] = len(previa) - casadas
+
+    tipos, prioridades = [None] * len(claves), [None] * len(claves)
+    nuevo_sc = {}
+    pendientes = []
+    con_resultado = previa is not None and col_tipo in previa.columns and col_prio in previa.columns
+    if con_resultado:
+        tipos_prev, prioridades_prev = previa[col_tipo].tolist(), previa[col_prio].tolist()
+    for i, (k, h, p) in enumerate(zip(claves, hashes, posiciones) if previa is not None else ()):
+        if p is not None and not con_resultado:
+            p = None
+        if p is not None:
+            # el sidecar se escribió con las claves de la fila emparejada; un sidecar v1 usa
+            # id: o ej: para todas las filas, así que se prueban los dos esquemas
+            sc = next((filas_sc[c] for c in claves_prev[p] if c in filas_sc), None)
+            vigente = mismas_reglas
+            if sc is None:
+                if respaldo is None:
+                    respaldo = _sidecar_desde_salida(previa)
+                sc, vigente = respaldo[p], True
+            actual = _resultado(tipos_prev[p], prioridades_prev[p])
+            if actual != (sc[1], sc[2]):
+                tipos[i], prioridades[i] = tipos_prev[p], prioridades_prev[p]
+                nuevo_sc[k] = [h, sc[1], sc[2]]    # sigue constando lo que dio el clasificador
+                resumen["manuales"] += 1
+                continue
+            if sc[0] == h and vigente:
+                tipos[i], prioridades[i] = sc[1], sc[2]
+                nuevo_sc[k] = sc
+                resumen["sin_cambios"] += 1
+                continue
+            resumen["cambiadas"] += 1
+        else:
+            resumen["nuevas"] += 1
+        pendientes.append(i)
+
+    if previa is None:
+        pendientes = list(range(len(claves)))
+        resumen["nuevas"] = len(claves)
+    if pendientes:
+        t, pr = clasificar_columna(entrada[_columna(entrada, 'ejercicio')].iloc[pendientes])
+        for i, tipo, prioridad in zip(pendientes, t.tolist(), pr.tolist()):
+            tipos[i], prioridades[i] = tipo, prioridad
+            nuevo_sc[claves[i]] = [hashes[i], tipo, prioridad]
+
+    salida[col_tipo] = tipos
+    salida[col_prio] = prioridades
+    if previa is not None:
+        orden = [c for c in previa.columns if c in salida.columns]
+        salida = salida[orden + [c for c in salida.columns if c not in orden]]
+    sidecar = {"version": VERSION_SIDECAR, "claves": ESQUEMA_CLAVES, "reglas": firma, "filas": nuevo_sc}
+    return salida, sidecar, dict(resumen)
+
+def clasificar_catalogo(entrada, salida, completo=False, forzar=False):
+    """Clasifica el Excel 'entrada' en 'salida' (incremental si ya existe, salvo completo=True).
+
+    Escribe la salida y su sidecar y devuelve el resumen de clasificar_incremental (ValueError,
+    sin escribir nada, si la salida anterior apenas casa con la entrada y no se pasa forzar).
+    """
+    df = pd.read_excel(entrada)     # FileNotFoundError si no existe
+    previa = sidecar = None
+    if not completo and os.path.exists(salida):
+        previa = pd.read_excel(salida)
+        sidecar = leer_sidecar(salida)
+    df, sidecar, resumen = clasificar_incremental(df, previa, sidecar, forzar=forzar)
+    df.to_excel(salida, index=False)
+    guardar_sidecar(salida, sidecar)
+    return resumen
+
+# --- PIPELINE POR BLOQUES ---
+# Para catálogos que no caben cómodos en memoria: la entrada se lee por bloques (openpyxl en
+# modo read_only o read_csv con chunksize), cada bloque se clasifica en un pool de procesos y
+# la salida se escribe en orden según van llegando (CSV por bloques u openpyxl write_only).
+# Como mucho hay 2 bloques por proceso en vuelo. Siempre es una clasificación completa.
+
+TAMANO_BLOQUE = 50_000
+
+def _es_csv(ruta):
+    return os.path.splitext(ruta)[1].lower() == ".csv"
+
+def leer_por_bloques(ruta, tamano=TAMANO_BLOQUE):
+    """DataFrames de hasta 'tamano' filas de un .csv o de la primera hoja de un .xlsx."""
+    if _es_csv(ruta):
+        yield from pd.read_csv(ruta, chunksize=tamano)
+        return
+    from openpyxl import load_workbook
+    libro = load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        filas = libro.worksheets[0].iter_rows(values_only=True)
+        cabecera = next(filas, None)
+        if cabecera is None:
+            return
+        columnas = [c if c is not None else f"Unnamed: {i}" for i, c in enumerate(cabecera)]
+        n = len(columnas)
+        bloque = []
+        for fila in filas:
+            if all(v is None for v in fila):
+                continue    # filas vacías (read_excel tampoco las trae al final de la hoja)
+            bloque.append(fila[:n] + (None,) * (n - len(fila)))
+            if len(bloque) >= tamano:
+                yield pd.DataFrame.from_records(bloque, columns=columnas)
+                bloque = []
+        if bloque:
+            yield pd.DataFrame.from_records(bloque, columns=columnas)
+    finally:
+        libro.close()
+
+def _clasificar_nombres(nombres, reglas):
+    tipos, prioridades = clasificar_columna(nombres, reglas)
+    return tipos.tolist(), prioridades.tolist()
+
+def clasificar_bloques(bloques, procesos=None, reglas=None):
+    """Clasifica un iterable de DataFrames y los devuelve en el mismo orden con tipo/prioridad.
+
+    Con procesos > 1 (por defecto, todos los núcleos) los bloques se reparten en un pool; a los
+    procesos solo viaja la columna 'ejercicio' y las reglas (las listas actuales del llamador).
+    """
+    reglas = reglas if reglas is not None else reglas_clasificacion()
+    procesos = max(1, procesos or os.cpu_count() or 1)
+
+    def _con_resultado(bloque, resultado):
+        tipos, prioridades = resultado
+        return bloque.assign(tipo_ejercicio=tipos, prioridad=prioridades)
+
+    def _nombres(bloque):
+        columna = _columna(bloque, 'ejercicio')
+        if columna is None:
+            raise KeyError("la entrada no tiene columna 'ejercicio'")
+        return bloque[columna].tolist()
+
+    if procesos == 1:
+        for bloque in bloques:
+            yield _con_resultado(bloque, _clasificar_nombres(_nombres(bloque), reglas))
+        return
+    ctx = mp.get_context("fork") if "fork" in mp.get_all_start_methods() else mp.get_context()
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=ctx) as pool:
+        en_vuelo = deque()
+        for bloque in bloques:
+            en_vuelo.append((bloque, pool.submit(_clasificar_nombres, _nombres(bloque), reglas)))
+            if len(en_vuelo) >= 2 * procesos:
+                bloque, futuro = en_vuelo.popleft()
+                yield _con_resultado(bloque, futuro.result())
+        while en_vuelo:
+            bloque, futuro = en_vuelo.popleft()
+            yield _con_resultado(bloque, futuro.result())
+
+class _SalidaCSV:
+    def __init__(self, ruta):
+        self._f = open(ruta, "w", newline="", encoding="utf-8")
+        self._cabecera = True
+
+    def escribir(self, bloque):
+        bloque.to_csv(self._f, header=self._cabecera, index=False)
+        self._cabecera = False
+
+    def cerrar(self):
+        self._f.close()
+
+class _SalidaXLSX:
+    def __init__(self, ruta):
+        from openpyxl import Workbook
+        self._ruta = ruta
+        self._libro = Workbook(write_only=True)    # las filas van a un temporal, no a memoria
+        self._hoja = self._libro.create_sheet()
+        self._cabecera = True
+
+    def escribir(self, bloque):
+        if self._cabecera:
+            self._hoja.append([str(c) for c in bloque.columns])
+            self._cabecera = False
+        # nulos (NaN / pd.NA) -> None, que openpyxl deja como celda vacía
+        for fila in bloque.astype(object).where(bloque.notna(), None).to_numpy().tolist():
+            self._hoja.append(fila)
+
+    def cerrar(self):
+        self._libro.save(self._ruta)
+
+def clasificar_archivo(entrada, salida, tamano=TAMANO_BLOQUE, procesos=None):
+    """Clasificación completa de 'entrada' a 'salida' (.csv o .xlsx) por bloques; devuelve las filas."""
+    if not os.path.exists(entrada):
+        raise FileNotFoundError(entrada)
+    escritor = _SalidaCSV(salida) if _es_csv(salida) else _SalidaXLSX(salida)
+    filas = 0
+    try:
+        for bloque in clasificar_bloques(leer_por_bloques(entrada, tamano), procesos):
+            escritor.escribir(bloque)
+            filas += len(bloque)
+    finally:
+        escritor.cerrar()
+    return filas
+
+# --- CLI ---
 NOMBRE_ARCHIVO_ENTRADA = "datos.xlsx"
 NOMBRE_ARCHIVO_SALIDA = "datos_clasificado.xlsx"
 
-print(f"Cargando el archivo '{NOMBRE_ARCHIVO_ENTRADA}'...")
-try:
-    df = pd.read_excel(NOMBRE_ARCHIVO_ENTRADA)
-except FileNotFoundError:
-    print(f"ERROR: No se encontró el archivo. Asegúrate de que '{NOMBRE_ARCHIVO_ENTRADA}' está en la carpeta.")
-    exit()
-
-print("Archivo cargado. Empezando clasificación automática...")
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Clasifica el catálogo de ejercicios (tipo_ejercicio / prioridad)")
+    ap.add_argument("--entrada", default=NOMBRE_ARCHIVO_ENTRADA, help=".xlsx (o .csv con --streaming)")
+    ap.add_argument("--salida", default=NOMBRE_ARCHIVO_SALIDA)
+    ap.add_argument("--completo", action="store_true", help="reclasifica todo y reescribe la salida desde cero")
+    ap.add_argument("--forzar", action="store_true",
+                    help="modo incremental aunque la salida anterior apenas case con la entrada")
+    ap.add_argument("--streaming", action="store_true",
+                    help="por bloques y en varios procesos, con memoria acotada (siempre completo)")
+    ap.add_argument("--bloque", type=int, default=TAMANO_BLOQUE, help="filas por bloque con --streaming")
+    ap.add_argument("--procesos", type=int, default=None, help="por defecto, todos los núcleos")
+    args = ap.parse_args(argv)
 
-# Aplicamos la función de clasificación a cada fila del DataFrame
-# Los resultados se guardan en dos nuevas listas temporales
-resultados = df['ejercicio'].apply(clasificar_ejercicio)
-df['tipo_ejercicio'] = [res[0] for res in resultados]
-df['prioridad'] = [res[1] for res in resultados]
+    print(f"Cargando el archivo '{args.entrada}'...")
+    if not os.path.exists(args.entrada):
+        print(f"ERROR: No se encontró el archivo. Asegúrate de que '{args.entrada}' está en la carpeta.")
+        return 1
 
-print("Clasificación completada.")
+    if args.streaming:
+        print("Clasificando por bloques...")
+        filas = clasificar_archivo(args.entrada, args.salida, args.bloque, args.procesos)
+        print(f"¡Éxito! {filas} ejercicios clasificados y guardados en '{args.salida}'.")
+        return 0
 
-# Guardamos el DataFrame con las nuevas columnas en un NUEVO archivo Excel
-df.to_excel(NOMBRE_ARCHIVO_SALIDA, index=False)
+    if not args.completo and os.path.exists(args.salida):
+        print(f"Modo incremental: se reutiliza '{args.salida}'"
+              + ("" if leer_sidecar(args.salida) else " (sin sidecar: sus valores se toman como revisados)") + ".")
+    print("Empezando clasificación automática...")
+    try:
+        resumen = clasificar_catalogo(args.entrada, args.salida, completo=args.completo, forzar=args.forzar)
+    except ValueError as e:
+        print(f"ERROR: {e} (--completo / --forzar). No se ha modificado '{args.salida}'.")
+        return 1
+    print("Clasificación completada: " + ", ".join(f"{v} {k.replace('_', ' ')}" for k, v in sorted(resumen.items())) + ".")
+    print(f"¡Éxito! Tu base de datos ha sido clasificada y guardada en '{args.salida}'.")
+    print("Ahora puedes revisar ese archivo, hacer los ajustes finales y usarlo en la app principal.")
+    return 0
 
-print(f"¡Éxito! Tu base de datos ha sido clasificada y guardada en '{NOMBRE_ARCHIVO_SALIDA}'.")
-print("Ahora puedes revisar ese archivo, hacer los ajustes finales y usarlo en la app principal.")
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
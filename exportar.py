@@ -0,0 +1,119 @@
+# exportar.py – exporta rangos de planes a CSV o Excel en streaming (memoria acotada)
+#
+# Uso:  python exportar.py --desde 2026-01-05 --dias 365 --atletas ana,luis --salida planes_2026.xlsx
+#
+#   exportar_rango(catalogo, PATTERNS, datetime(2026, 1, 5), "planes_2026.csv", days=365,
+#                  atletas=["ana", "luis"])
+#
+# Los días se generan con planner.iter_rango y se escriben en cuanto salen: nunca se monta la
+# tabla entera. En .xlsx se usa el modo constant_memory de xlsxwriter (cada fila se vuelca al
+# disco al pasar a la siguiente) y, si se supera el máximo de filas de Excel, sigue en otra hoja.
+from __future__ import annotations
+import argparse
+import csv
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+import pandas as pd
+
+from catalogo import Catalogo, cargar_catalogo, como_catalogo
+from planner import COLUMNAS_RANGO, SEMILLA, iter_rango
+
+COLUMNAS = ["atleta", *COLUMNAS_RANGO]
+MAX_FILAS_XLSX = 1_048_576      # límite de filas por hoja de Excel (cabecera incluida)
+
+def partes_rango(df: pd.DataFrame | Catalogo, patterns: Dict[str, Any], start: datetime, days: int = 7,
+                 semana_mesociclo: int = 1, semilla: int = SEMILLA,
+                 atletas: Iterable[str] = ("",)) -> Iterator[pd.DataFrame]:
+    """Tabla plana de cada (atleta, día) con las columnas de COLUMNAS, una detrás de otra."""
+    cat = como_catalogo(df)
+    for atleta in atletas:
+        for parte in iter_rango(cat, patterns, start, days, semana_mesociclo, semilla, atleta):
+            if parte.empty:
+                continue
+            parte = parte.reindex(columns=COLUMNAS_RANGO)
+            parte.insert(0, "atleta", atleta)
+            yield parte
+
+class _EscritorCSV:
+    def __init__(self, ruta: str):
+        self._f = open(ruta, "w", newline="", encoding="utf-8")
+        csv.writer(self._f).writerow(COLUMNAS)
+
+    def escribir(self, parte: pd.DataFrame) -> None:
+        parte.to_csv(self._f, header=False, index=False)
+
+    def cerrar(self) -> None:
+        self._f.close()
+
+class _EscritorXLSX:
+    def __init__(self, ruta: str):
+        try:
+            import xlsxwriter
+        except ImportError as e:
+            raise ImportError("Exportar a .xlsx requiere xlsxwriter (pip install xlsxwriter)") from e
+        # strings_to_*: los textos del catálogo se escriben tal cual, nunca como fórmula o enlace
+        self._libro = xlsxwriter.Workbook(ruta, {"constant_memory": True, "strings_to_formulas": False,
+                                                 "strings_to_urls": False, "strings_to_numbers": False})
+        self._hojas = 0
+        self._hoja_nueva()
+
+    def _hoja_nueva(self) -> None:
+        self._hojas += 1
+        self._hoja = self._libro.add_worksheet("Planes" if self._hojas == 1 else f"Planes {self._hojas}")
+        self._hoja.write_row(0, 0, COLUMNAS)
+        self._fila = 1
+
+    def escribir(self, parte: pd.DataFrame) -> None:
+        # nulos (NaN / pd.NA) -> None, que xlsxwriter deja como celda vacía
+        valores = parte.astype(object).where(parte.notna(), None).to_numpy().tolist()
+        for fila in valores:
+            if self._fila >= MAX_FILAS_XLSX:
+                self._hoja_nueva()
+            self._hoja.write_row(self._fila, 0, fila)
+            self._fila += 1
+
+    def cerrar(self) -> None:
+        self._libro.close()
+
+def exportar_rango(df: pd.DataFrame | Catalogo, patterns: Dict[str, Any], start: datetime, ruta: str,
+                   days: int = 7, semana_mesociclo: int = 1, semilla: int = SEMILLA,
+                   atletas: Iterable[str] = ("",), formato: Optional[str] = None) -> int:
+    """Escribe el rango de cada atleta en 'ruta' (.csv o .xlsx) y devuelve las filas escritas.
+
+    formato: "csv" o "xlsx"; por defecto según la extensión de 'ruta'.
+    """
+    formato = formato or os.path.splitext(ruta)[1].lower().lstrip(".") or "csv"
+    if formato not in ("csv", "xlsx"):
+        raise ValueError(f"formato no soportado: {formato!r} (usa 'csv' o 'xlsx')")
+    escritor = _EscritorXLSX(ruta) if formato == "xlsx" else _EscritorCSV(ruta)
+    filas = 0
+    try:
+        for parte in partes_rango(df, patterns, start, days, semana_mesociclo, semilla, atletas):
+            escritor.escribir(parte)
+            filas += len(parte)
+    finally:
+        escritor.cerrar()
+    return filas
+
+def main():
+    ap = argparse.ArgumentParser(description="Exporta planes de un rango de fechas a CSV o Excel")
+    ap.add_argument("--catalogo", default="datos_clasificado.xlsx")
+    ap.add_argument("--desde", required=True, help="primera fecha (YYYY-MM-DD)")
+    ap.add_argument("--dias", type=int, default=7)
+    ap.add_argument("--semana", type=int, default=1, help="semana del mesociclo")
+    ap.add_argument("--semilla", type=int, default=SEMILLA)
+    ap.add_argument("--atletas", default="", help="lista separada por comas (vacío: plan genérico)")
+    ap.add_argument("--salida", required=True, help="archivo .csv o .xlsx")
+    args = ap.parse_args()
+
+    from patterns_bau import PATTERNS
+    atletas = [a.strip() for a in args.atletas.split(",")] if args.atletas else [""]
+    filas = exportar_rango(cargar_catalogo(args.catalogo), PATTERNS, datetime.strptime(args.desde, "%Y-%m-%d"),
+                           args.salida, days=args.dias, semana_mesociclo=args.semana, semilla=args.semilla,
+                           atletas=atletas)
+    print(f"{filas} filas escritas en {args.salida}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# lote.py – generación de planes en lote (muchos atletas) repartida en varios procesos
+from __future__ import annotations
+import multiprocessing as mp
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from catalogo import Catalogo, como_catalogo
+from planner import SEMILLA, plan_semana
+from reglas import PatternsCompilados, compilar_patterns
+from storage import StorageBackend, _serialize, _to_json_safe, get_backend, label_from_date
+
+@dataclass(frozen=True)
+class Trabajo:
+    atleta: str
+    plantilla: str = "bau"          # clave en el dict 'plantillas' de planificar_lote
+    semana_mesociclo: int = 1
+    label: Optional[str] = None     # por defecto "<lunes>_<atleta>"
+    semilla: int = SEMILLA          # el sorteo depende de (semilla, atleta, semana)
+
+@dataclass
+class ResultadoLote:
+    guardados: List[Tuple[Trabajo, str]] = field(default_factory=list)   # (trabajo, ruta)
+    fallos: List[Tuple[Trabajo, str]] = field(default_factory=list)      # (trabajo, error)
+    segundos: float = 0.0
+    procesos: int = 1
+
+    @property
+    def planes_por_segundo(self) -> float:
+        return len(self.guardados) / self.segundos if self.segundos else 0.0
+
+    def resumen(self) -> str:
+        return (f"{len(self.guardados)} planes guardados, {len(self.fallos)} fallos en "
+                f"{self.segundos:.1f}s con {self.procesos} procesos ({self.planes_por_segundo:.1f} planes/s)")
+
+# Planes que se guardan juntos en el backend (un fsync de directorio / una escritura del
+# manifiesto / una transacción por tanda). Más grande = menos trabajo en el proceso principal,
+# pero al_completar se llama por tandas.
+TAM_TANDA = 32
+
+# ---------------- Estado de cada proceso trabajador ----------------
+# Con 'fork' el catálogo se hereda (copia en escritura, compartido de solo lectura);
+# con 'forkserver'/'spawn' se envía una vez por proceso en el inicializador, nunca por trabajo.
+_CATALOGO: Optional[Catalogo] = None
+_PLANTILLAS: Dict[str, PatternsCompilados] = {}
+_FORMATO: Optional[str] = None
+
+def _init_trabajador(catalogo: Optional[Catalogo], plantillas: Dict[str, Dict[str, Any]],
+                     formato: Optional[str] = None) -> None:
+    global _CATALOGO, _PLANTILLAS, _FORMATO
+    if catalogo is not None:
+        _CATALOGO = catalogo
+    _PLANTILLAS = {k: compilar_patterns(v) for k, v in plantillas.items()}
+    _FORMATO = formato
+
+def _planificar(trabajo: Trabajo) -> Tuple[dict, Optional[bytes]]:
+    """(plan json-safe, bytes en el formato del backend o None): se serializa en el trabajador."""
+    plan = plan_semana(_CATALOGO, _PLANTILLAS[trabajo.plantilla], semana_mesociclo=trabajo.semana_mesociclo,
+                       semilla=trabajo.semilla, atleta=trabajo.atleta)
+    return _serialize(plan, _FORMATO) if _FORMATO else (_to_json_safe(plan), None)
+
+def _contexto() -> mp.context.BaseContext:
+    # 'fork' con otros hilos vivos (write-behind, Streamlit...) puede dejar al hijo con un lock
+    # tomado para siempre: entonces forkserver (o spawn), que no copian este proceso
+    metodos = mp.get_all_start_methods()
+    if "fork" in metodos and threading.active_count() == 1:
+        return mp.get_context("fork")
+    return mp.get_context("forkserver" if "forkserver" in metodos else "spawn")
+
+def _fuente(patterns: Dict[str, Any] | PatternsCompilados) -> Dict[str, Any]:
+    # Las plantillas compiladas no son picklables: a los procesos se envía el dict original
+    return patterns.fuente if isinstance(patterns, PatternsCompilados) else patterns
+
+# ---------------- API ----------------
+
+def planificar_lote(
+    catalogo: pd.DataFrame | Catalogo,
+    trabajos: List[Trabajo],
+    plantillas: Optional[Dict[str, Dict[str, Any] | PatternsCompilados]] = None,
+    fecha: Optional[date] = None,
+    procesos: Optional[int] = None,
+    al_completar: Optional[Callable[[Trabajo, Optional[str], Optional[str]], None]] = None,
+    backend: Optional[StorageBackend] = None,
+) -> ResultadoLote:
+    """Planifica la semana de cada trabajo en paralelo y la guarda en 'backend'.
+
+    'backend' por defecto es storage.get_backend() (archivos, o SQLite con PLANES_BACKEND=sqlite).
+    Los trabajadores devuelven el plan ya serializado; el proceso principal (único escritor)
+    lo guarda por tandas de TAM_TANDA con backend.save_weeks si existe.
+    'al_completar(trabajo, ruta, error)' permite mostrar progreso. Un trabajo que falla no
+    detiene el lote: queda en ResultadoLote.fallos con su error.
+    """
+    global _CATALOGO, _PLANTILLAS, _FORMATO
+    if plantillas is None:
+        from patterns_bau import PATTERNS
+        plantillas = {"bau": PATTERNS}
+    plantillas = {k: _fuente(v) for k, v in plantillas.items()}
+    backend = backend or get_backend()
+    cat = como_catalogo(catalogo)
+    cat.indice, cat.huella  # calculados antes de repartir: cada proceso los reutiliza
+    lunes = label_from_date(fecha or date.today())
+    procesos = max(1, min(procesos or os.cpu_count() or 1, len(trabajos) or 1))
+    res = ResultadoLote(procesos=procesos)
+
+    formato = getattr(backend, "formato", None)
+    tanda: List[Tuple[Trabajo, dict, Optional[bytes]]] = []
+
+    def _anotar(trabajo: Trabajo, ruta: Optional[str], error: Optional[str]) -> None:
+        if error is None:
+            res.guardados.append((trabajo, ruta))
+        else:
+            res.fallos.append((trabajo, error))
+        if al_completar is not None:
+            al_completar(trabajo, ruta, error)
+
+    def _etiqueta(trabajo: Trabajo) -> str:
+        return trabajo.label or f"{lunes}_{trabajo.atleta}"
+
+    def _vaciar() -> None:
+        lote = [(_etiqueta(t), safe, data) for t, safe, data in tanda]
+        try:
+            if hasattr(backend, "save_weeks"):
+                guardados = backend.save_weeks(lote)
+            else:
+                guardados = []
+                for label, safe, _ in lote:
+                    try:
+                        guardados.append((label, backend.save_week(safe, label), None))
+                    except Exception as e:
+                        guardados.append((label, None, e))
+        except Exception as e:
+            guardados = [(label, None, e) for label, _, _ in lote]
+        for (t, _, _), (_, ruta, e) in zip(tanda, guardados):
+            _anotar(t, ruta, None if e is None else f"{type(e).__name__}: {e}")
+        tanda.clear()
+
+    def _guardar(trabajo: Trabajo, serializado: Optional[tuple], error: Optional[str]) -> None:
+        if error is not None:
+            _anotar(trabajo, None, error)
+            return
+        tanda.append((trabajo, *serializado))
+        if len(tanda) >= TAM_TANDA:
+            _vaciar()
+
+    t0 = time.perf_counter()
+    faltan = [t for t in trabajos if t.plantilla not in plantillas]
+    for t in faltan:
+        _guardar(t, None, f"KeyError: plantilla desconocida '{t.plantilla}'")
+    trabajos = [t for t in trabajos if t.plantilla in plantillas]
+
+    previo = (_CATALOGO, _PLANTILLAS, _FORMATO)     # el estado de trabajador no sale de esta llamada
+    try:
+        if procesos == 1:
+            _init_trabajador(cat, plantillas, formato)
+            for t in trabajos:
+                try:
+                    serializado, error = _planificar(t), None
+                except Exception as e:
+                    serializado, error = None, f"{type(e).__name__}: {e}"
+                _guardar(t, serializado, error)
+        else:
+            ctx = _contexto()
+            heredado = ctx.get_start_method() == "fork"
+            if heredado:
+                _CATALOGO = cat     # lo heredan los procesos al hacer fork
+            with ProcessPoolExecutor(max_workers=procesos, mp_context=ctx, initializer=_init_trabajador,
+                                     initargs=(None if heredado else cat, plantillas, formato)) as pool:
+                futuros = {pool.submit(_planificar, t): t for t in trabajos}
+                for fut in as_completed(futuros):
+                    t = futuros[fut]
+                    try:
+                        serializado, error = fut.result(), None
+                    except Exception as e:
+                        serializado, error = None, f"{type(e).__name__}: {e}"
+                    _guardar(t, serializado, error)
+    finally:
+        _CATALOGO, _PLANTILLAS, _FORMATO = previo
+    if tanda:
+        _vaciar()
+
+    res.segundos = time.perf_counter() - t0
+    return res
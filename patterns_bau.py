@@ -349,3 +349,7 @@ PATTERNS = {
         }
     }
 }
+
+# Compilado una sola vez al importar: el planner ejecuta directamente estos predicados
+from reglas import compilar_patterns
+PATTERNS_COMPILADOS = compilar_patterns(PATTERNS)
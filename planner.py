@@ -1,133 +1,231 @@
 # planner.py (v4.1) – robusto: _filter/_fallback sin KeyError + fix 'orden' superseries
 from __future__ import annotations
+import logging
+import threading
+import zlib
+from collections import Counter, OrderedDict
+from collections.abc import Mapping
+from dataclasses import dataclass, field, replace
+import numpy as np
 import pandas as pd
-from typing import Dict, Any, List
-
-# ---------------- Utilidades internas ----------------
-
-def _norm(s):
-    if pd.isna(s):
-        return ""
-    return str(s).strip().lower()
-
-def _match_patrones(row, patrones: List[str]) -> bool:
-    if not patrones:
-        return True
-    texto = " ".join([_norm(row.get('categoria')), _norm(row.get('subcategoria')), _norm(row.get('ejercicio'))])
-    pats = [p.lower() for p in patrones]
-    return any(p in texto for p in pats)
-
-def _match_tags(row, tags: List[str]) -> bool:
-    if not tags:
-        return True
-    texto = " ".join([_norm(row.get('categoria')), _norm(row.get('subcategoria')), _norm(row.get('ejercicio'))])
-    tgs = [t.lower() for t in tags]
-    return all(t in texto for t in tgs)
-
-def _match_tipo(row, tipo: str|None) -> bool:
-    if not tipo:
-        return True
-    return _norm(row.get('tipo_ejercicio')) == _norm(tipo)
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from catalogo import Catalogo, como_catalogo
+from reglas import (Criterio, ReglaCompilada, BloqueCompilado, PlantillaCompilada,
+                    PatternsCompilados, compilar_bloque, compilar_plantilla, compilar_patterns)
+
+log = logging.getLogger(__name__)
+
+# ---------------- Caché de candidatos ----------------
+class CacheCandidatos:
+    """LRU de posiciones de candidatos, clave (huella del catálogo, criterio canónico, etapa).
+
+    La huella es un hash del contenido del catálogo: si cambia datos_clasificado.xlsx, o un
+    DataFrame suelto se modifica in situ (como_catalogo lo vuelve a hashear en cada llamada y
+    un Catalogo no ve cambios posteriores de su DataFrame de origen), las claves antiguas dejan
+    de usarse solas y acaban expulsadas por el LRU.
+    """
+
+    def __init__(self, max_entradas: int = 4096):
+        self.max_entradas = max_entradas
+        self.aciertos = 0
+        self.fallos = 0
+        self._datos: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave, calcular):
+        with self._lock:
+            if clave in self._datos:
+                self._datos.move_to_end(clave)
+                self.aciertos += 1
+                return self._datos[clave]
+        valor = calcular()
+        with self._lock:
+            self.fallos += 1
+            self._datos[clave] = valor
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+        return valor
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._datos.clear()
+            self.aciertos = self.fallos = 0
+
+    def estadisticas(self) -> Dict[str, int]:
+        with self._lock:
+            return {"aciertos": self.aciertos, "fallos": self.fallos,
+                    "entradas": len(self._datos), "max_entradas": self.max_entradas}
+
+CACHE_CANDIDATOS = CacheCandidatos()
+
+def estadisticas_cache() -> Dict[str, int]:
+    return CACHE_CANDIDATOS.estadisticas()
+
+def limpiar_cache() -> None:
+    CACHE_CANDIDATOS.limpiar()
 
 # ---------------- Filtro robusto ----------------
-def _filter(df: pd.DataFrame, regla: Dict[str, Any]) -> pd.DataFrame:
+def _criterio(regla) -> Criterio:
+    if isinstance(regla, Criterio):
+        return regla
+    if isinstance(regla, ReglaCompilada):
+        return regla.criterio
+    return Criterio.desde_dict(regla)
+
+def _sin_duplicados(cat: Catalogo, pos: np.ndarray) -> np.ndarray:
+    # Drop dup sin asumir que exista 'ejercicio' (si no, la primera columna)
+    if len(pos) > 0:
+        pos = pos[~cat.df[cat.col_dedup].iloc[pos].duplicated().to_numpy()]
+    pos.setflags(write=False)  # se comparte desde la caché
+    return pos
+
+def _posiciones_filtro(cat: Catalogo, c: Criterio):
+    """Posiciones (iloc) que devuelve _filter; None = DF vacío sin columnas. Cacheado."""
+    def calcular():
+        mascara = c.mascara(cat.indice)
+        if mascara is None:
+            return None
+        return _sin_duplicados(cat, np.flatnonzero(mascara))
+    return CACHE_CANDIDATOS.obtener((cat.huella, "filtro", c), calcular)
+
+def _filter(df: pd.DataFrame | Catalogo, regla: Dict[str, Any] | ReglaCompilada | Criterio) -> pd.DataFrame:
     """Filtra candidatos de forma segura (sin crashear si faltan columnas o quedan 0 columnas)."""
     if df is None or df.empty:
-        return df
-
-    cand = df.copy()
-
-    # --- Normaliza nombres esperados (por si vienen en mayúsculas/acentos) ---
-    rename_map = {}
-    for c in list(cand.columns):
-        cl = str(c).strip().lower()
-        if cl in ("ejercicio",):
-            rename_map[c] = "ejercicio"
-        elif cl in ("tipo_ejercicio", "tipo ejercicio"):
-            rename_map[c] = "tipo_ejercicio"
-        elif cl in ("categoria", "categoría"):
-            rename_map[c] = "categoria"
-        elif cl in ("subcategoria", "sub-categoria", "subcategoría"):
-            rename_map[c] = "subcategoria"
-        elif cl in ("prioridad",):
-            rename_map[c] = "prioridad"
-    if rename_map:
-        cand = cand.rename(columns=rename_map)
-
-    # Normaliza 'prioridad' si existe
-    if "prioridad" in cand.columns:
-        cand["prioridad"] = pd.to_numeric(cand["prioridad"], errors="coerce")
-
-    # Filtros (solo si las columnas existen)
-    if "tipo_ejercicio" in regla and regla["tipo_ejercicio"] and "tipo_ejercicio" in cand.columns:
-        cand = cand[cand.apply(lambda r: _match_tipo(r, regla["tipo_ejercicio"]), axis=1)]
-
-    if "patrones" in regla and regla["patrones"]:
-        cand = cand[cand.apply(lambda r: _match_patrones(r, regla["patrones"]), axis=1)]
-
-    if "tags_incluye" in regla and regla["tags_incluye"]:
-        cand = cand[cand.apply(lambda r: _match_tags(r, regla["tags_incluye"]), axis=1)]
-
-    if "prioridad" in regla and regla["prioridad"] is not None and "prioridad" in cand.columns:
-        try:
-            prio_val = int(regla["prioridad"])
-            cand = cand[cand["prioridad"] == prio_val]
-        except Exception:
-            pass  # si no convierte, ignoramos filtro de prioridad
+        return df.df if isinstance(df, Catalogo) else df
+
+    cat = como_catalogo(df)
+    pos = _posiciones_filtro(cat, _criterio(regla))
 
     # --- Si tras filtrar no quedan columnas, devolver DF vacío y salir limpio ---
-    if cand.shape[1] == 0:
+    if pos is None:
         return pd.DataFrame()
-
-    # Drop dup sin asumir que exista 'ejercicio'
-    if "ejercicio" in cand.columns:
-        cand = cand.drop_duplicates(subset=["ejercicio"])
-    else:
-        # si no hay 'ejercicio' pero sí alguna columna, usamos la primera
-        first_col = cand.columns[0] if len(cand.columns) else None
-        if first_col is not None:
-            cand = cand.drop_duplicates(subset=[first_col])
-
-    return cand
-
-
-def _fallback(df: pd.DataFrame, regla: Dict[str, Any]) -> pd.DataFrame:
+    return cat.filas(pos)
+
+
+# ---------------- Relajación en una sola pasada ----------------
+# Niveles de _elegir: 0 = regla exacta; 1-3 = relajaciones de _fallback; 4 = último recurso
+NIVELES = ("exacto", "sin_prioridad", "sin_tipo", "sin_patrones", "ultimo_recurso")
+_USO_NIVELES: Counter = Counter()
+_USO_LOCK = threading.Lock()
+
+def estadisticas_fallback() -> Dict[str, int]:
+    """Cuántas selecciones se resolvieron en cada nivel de relajación desde el arranque."""
+    with _USO_LOCK:
+        return {n: _USO_NIVELES[n] for n in NIVELES}
+
+def _posiciones_relajadas(cat: Catalogo, c: Criterio, desde: int = 0):
+    """(posiciones, nivel) del primer nivel no vacío a partir de 'desde'. Cacheado.
+
+    Las máscaras por criterio se calculan una vez y los niveles se componen por
+    intersección: 3) tags, 2) + patrones, 1) + tipo, 0) + prioridad.
+    """
+    def calcular():
+        idx = cat.indice
+        todas = np.ones(idx.n, dtype=bool)
+        m3 = idx.mascara_todos(c.tags) if c.tags else todas
+        m2 = m3 & idx.mascara_alguno(c.patrones) if c.patrones else m3
+        m1 = m2 & idx.mascara_tipo(c.tipo) if c.tipo is not None and idx.tiene_tipo else m2
+        m0 = m1 & idx.mascara_prioridad(c.prioridad) if c.prioridad is not None and idx.tiene_prioridad else m1
+        for nivel, m in enumerate((m0, m1, m2, m3)):
+            if nivel >= desde and m.any():
+                return _sin_duplicados(cat, np.flatnonzero(m)), nivel
+        # 4) último recurso: devolver algo con lo que haya
+        if "ejercicio" in cat.df.columns:
+            dup = cat.df["ejercicio"].duplicated()
+        else:
+            dup = cat.df.duplicated()
+        pos = np.flatnonzero(~dup.to_numpy())[:5]
+        pos.setflags(write=False)
+        return pos, 4
+    return CACHE_CANDIDATOS.obtener((cat.huella, "relajacion", c, desde), calcular)
+
+def _posiciones_candidatos(cat: Catalogo, regla) -> np.ndarray:
+    """Posiciones candidatas de la regla relajando lo necesario en una pasada."""
+    c = _criterio(regla)
+    pos, nivel = _posiciones_relajadas(cat, c)
+    with _USO_LOCK:
+        _USO_NIVELES[NIVELES[nivel]] += 1
+    if nivel > 0:
+        log.info("Regla degradada a '%s': %s", NIVELES[nivel], c)
+    return pos
+
+def _fallback(df: pd.DataFrame | Catalogo, regla: Dict[str, Any] | ReglaCompilada | Criterio) -> pd.DataFrame:
     """Relaja filtros progresivamente para evitar bloques vacíos."""
     if df is None or df.empty:
-        return df
-
-    r2 = dict(regla)
-
-    # 1) quitar prioridad
-    r2.pop("prioridad", None)
-    cand = _filter(df, r2)
-    if not cand.empty:
-        return cand
-
-    # 2) quitar tipo
-    r2.pop("tipo_ejercicio", None)
-    cand = _filter(df, r2)
-    if not cand.empty:
-        return cand
-
-    # 3) quitar patrones
-    r2.pop("patrones", None)
-    cand = _filter(df, r2)
-    if not cand.empty:
-        return cand
-
-    # 4) último recurso: devolver algo con lo que haya
-    if df.shape[1] == 0:
-        return pd.DataFrame()
-    if "ejercicio" in df.columns:
-        return df.drop_duplicates(subset=["ejercicio"]).head(5)
-    return df.drop_duplicates().head(5)
+        return df.df if isinstance(df, Catalogo) else df
 
+    # 1) quitar prioridad, 2) quitar tipo, 3) quitar patrones, 4) lo que haya
+    cat = como_catalogo(df)
+    pos, _nivel = _posiciones_relajadas(cat, _criterio(regla), desde=1)
+    return cat.filas(pos)
 
-# ---------------- Parámetros / selección ----------------
 
-def _set_params(df: pd.DataFrame, regla: Dict[str, Any], semana: int) -> pd.DataFrame:
-    df = df.copy()
+# ---------------- Parámetros / selección ----------------
+# Los constructores de bloques trabajan con posiciones de fila (_Items): primero anotan los
+# candidatos de cada bloque, luego _sortear elige en un solo paso para todo el día y al
+# final las filas del catálogo (con explicacion, video…) se copian una vez por sesión.
+
+SEMILLA = 42
+
+def generador(semana: int = 1, semilla: int = SEMILLA, atleta: str = "") -> np.random.Generator:
+    """Generator reproducible por (semilla, atleta, semana del mesociclo)."""
+    return np.random.default_rng([semilla, zlib.crc32(str(atleta).encode("utf-8")), semana])
+
+def generadores_dia(dia: str, bloques: int, semana: int = 1, semilla: int = SEMILLA,
+                    atleta: str = "") -> List[np.random.Generator]:
+    """Un Generator por bloque del día, sembrado con (semilla, atleta, semana, día, posición).
+
+    Cada bloque tiene su propio flujo: cambiar la regla de un bloque (o sus candidatos) no
+    altera lo que sale en los demás bloques ni en los demás días.
+    """
+    base = [semilla, zlib.crc32(str(atleta).encode("utf-8")), semana, zlib.crc32(str(dia).encode("utf-8"))]
+    return [np.random.default_rng(np.random.SeedSequence(base + [j])) for j in range(bloques)]
+
+@dataclass
+class _Items:
+    """Ejercicios de un bloque sin materializar: tramos a sortear + columnas a fijar."""
+    tramos: List[Tuple[np.ndarray, int]]   # (posiciones candidatas, cuántas elegir)
+    ajustes: Dict[str, Any] = field(default_factory=dict)   # columna -> escalar o lista por fila
+    circuito: bool = False   # CircuitoPar: índice 0..n-1, columna 'orden' y orden por superserie
+    pos: Optional[np.ndarray] = None   # posiciones elegidas (las rellena _sortear)
+
+    def __len__(self) -> int:
+        return sum(min(n, len(c)) for c, n in self.tramos)
+
+def _sortear(lista: List[_Items], rng: np.random.Generator | List[np.random.Generator]) -> None:
+    """Elige las posiciones de todos los tramos en un solo paso.
+
+    Cada candidato recibe una clave aleatoria y en cada tramo se quedan las n menores
+    (muestreo sin reemplazo). Si el tramo tiene n candidatos o menos, se quedan todos en
+    el orden del catálogo. 'rng' es un Generator para toda la lista o uno por elemento
+    (las claves de cada _Items salen entonces solo de su Generator).
+    """
+    tramos = [t for it in lista for t in it.tramos]
+    largos = np.array([len(c) for c, _ in tramos], dtype=np.int64)
+    n = np.minimum(np.array([max(0, k) for _, k in tramos], dtype=np.int64), largos)
+    total = int(largos.sum())
+    if total:
+        todos = np.concatenate([c for c, _ in tramos]).astype(np.int64, copy=False)
+        tramo = np.repeat(np.arange(len(tramos)), largos)
+        if isinstance(rng, np.random.Generator):
+            claves = rng.random(total)
+        else:
+            claves = np.concatenate([g.random(sum(len(c) for c, _ in it.tramos)) for it, g in zip(lista, rng)])
+        claves[np.repeat(n == largos, largos)] = 0.0     # lexsort es estable: orden original
+        orden = np.lexsort((claves, tramo))
+        rango = np.arange(total) - np.repeat(np.cumsum(largos) - largos, largos)
+        elegidos = todos[orden[rango < np.repeat(n, largos)]]
+    else:
+        elegidos = np.empty(0, dtype=np.int64)
+    partes = np.split(elegidos, np.cumsum(n)[:-1]) if len(tramos) else []
+    i = 0
+    for it in lista:
+        k = len(it.tramos)
+        it.pos = np.concatenate(partes[i:i + k]) if k else np.empty(0, dtype=np.int64)
+        i += k
+
+def _set_params(cat: Catalogo, items: _Items, regla: Dict[str, Any] | ReglaCompilada, semana: int) -> _Items:
     series_rng = regla.get("series", (2,3))
     reps = regla.get("reps", "8-12")
     rpe_rng = regla.get("RPE", (7,8))
@@ -146,70 +244,84 @@ def _set_params(df: pd.DataFrame, regla: Dict[str, Any], semana: int) -> pd.Data
         series = max(series_rng)
         rpe = rpe_rng[-1]
 
-    if len(df) > 0:
-        df['series'] = series
-        df['repeticiones'] = reps
-        df['RPE'] = rpe
-        if 'descanso' not in df.columns: df['descanso'] = 60
-        if 'tempo' not in df.columns: df['tempo'] = ""
-    return df
-
-def _elegir(df: pd.DataFrame, regla: Dict[str, Any], n: int, semana: int) -> pd.DataFrame:
-    cand = _filter(df, regla)
-    if len(cand) == 0:
-        cand = _fallback(df, regla)
-    if len(cand) == 0:
-        return cand
-    sel = cand.sample(n=n, random_state=42) if len(cand) > n else cand
-    return _set_params(sel, regla, semana)
+    if len(items) > 0:
+        items.ajustes['series'] = series
+        items.ajustes['repeticiones'] = reps
+        items.ajustes['RPE'] = rpe
+        if 'descanso' not in cat.columnas: items.ajustes['descanso'] = 60
+        if 'tempo' not in cat.columnas: items.ajustes['tempo'] = ""
+    return items
+
+def _elegir(cat: Catalogo, regla: Dict[str, Any] | ReglaCompilada, n: int, semana: int) -> _Items:
+    # solo anota los candidatos: la elección se hace después, en _sortear
+    pos = np.empty(0, dtype=np.int64) if cat.empty else _posiciones_candidatos(cat, regla)
+    return _set_params(cat, _Items([(pos, n)]), regla, semana)
+
+def _materializar(cat: Catalogo, lista: List[_Items]) -> List[pd.DataFrame]:
+    """DataFrames de items de varios bloques con una sola copia de filas del catálogo."""
+    if not lista:
+        return []
+    filas = cat.filas(np.concatenate([it.pos for it in lista]))
+    out = []
+    inicio = 0
+    for it in lista:
+        fin = inicio + len(it.pos)
+        if it.circuito and fin == inicio:
+            out.append(pd.DataFrame())
+            continue
+        df = filas.iloc[inicio:fin]
+        inicio = fin
+        if it.circuito:
+            df = df.reset_index(drop=True)
+        df = df.assign(**it.ajustes) if it.ajustes else df.copy()
+        if it.circuito:
+            # FIX sin warnings: crea 'orden' desde 'superserie'
+            nums = pd.to_numeric(
+                df['superserie'].astype(str).str.extract(r'(\d+)')[0],
+                errors='coerce'
+            ).fillna(0)
+            df['orden'] = nums.astype('Int64')  # entero nullable
+            df = df.sort_values(['superserie']).reset_index(drop=True)
+        out.append(df)
+    return out
 
 # ---------------- Constructores de bloques ----------------
 
-def _construir_circuito_par(df: pd.DataFrame, regla: Dict[str, Any], semana: int) -> pd.DataFrame:
-    parejas = regla.get("parejas", [])
+def _construir_circuito_par(cat: Catalogo, regla: ReglaCompilada, semana: int) -> _Items:
+    parejas = regla.parejas
     series_circuito = int(regla.get("series_circuito", 3))
     reps = regla.get("reps", "10-12")
     rpe_rng = regla.get("RPE", (7,8))
     descanso_entre_ej = int(regla.get("descanso_entre_ej", 0))
     descanso_entre_series = int(regla.get("descanso_entre_series", 60))
 
-    filas = []
+    tramos, superseries, descansos = [], [], []
+    ajustes: Dict[str, Any] = {}
     nombre_super = ['A','B','C','D','E','F']
     idx_super = 0
 
-    for par in parejas:
-        if len(par) != 2:
+    for regla_a, regla_b in parejas:
+        a = _elegir(cat, regla_a, 1, semana)
+        b = _elegir(cat, regla_b, 1, semana)
+        if len(a) == 0 or len(b) == 0:
             continue
-        regla_a, regla_b = par
-        a = _elegir(df, regla_a, 1, semana)
-        b = _elegir(df, regla_b, 1, semana)
-        if a.empty or b.empty:
-            continue
-        a = a.copy(); b = b.copy()
         sup_id = f"SS{nombre_super[idx_super % len(nombre_super)]}"
         idx_super += 1
         for parte, lado in [(a, '1'), (b, '2')]:
-            parte['repeticiones'] = reps
-            parte['series'] = series_circuito
-            parte['RPE'] = min(9, rpe_rng[-1] if semana in (2,3) else rpe_rng[0])
-            parte['superserie'] = sup_id
-            parte['descanso'] = descanso_entre_ej if lado == '1' else descanso_entre_series
-            filas.append(parte)
-
-    if not filas:
-        return pd.DataFrame()
+            tramos += parte.tramos
+            superseries += [sup_id] * len(parte)
+            descansos += [descanso_entre_ej if lado == '1' else descanso_entre_series] * len(parte)
+            ajustes.update(parte.ajustes)
 
-    out = pd.concat(filas, ignore_index=True)
+    if not tramos:
+        return _Items([], circuito=True)
 
-    # FIX sin warnings: crea 'orden' desde 'superserie'
-    nums = pd.to_numeric(
-        out['superserie'].astype(str).str.extract(r'(\d+)')[0],
-        errors='coerce'
-    ).fillna(0)
-    out['orden'] = nums.astype('Int64')  # entero nullable
-    out = out.sort_values(['superserie']).reset_index(drop=True)
-
-    return out
+    ajustes['repeticiones'] = reps
+    ajustes['series'] = series_circuito
+    ajustes['RPE'] = min(9, rpe_rng[-1] if semana in (2,3) else rpe_rng[0])
+    ajustes['superserie'] = superseries
+    ajustes['descanso'] = descansos
+    return _Items(tramos, ajustes, circuito=True)
 
 def _bloque_caminar(regla: Dict[str, Any], semana: int) -> Dict[str, Any]:
     dur = int(regla.get('duracion_min', 12))
@@ -226,61 +338,149 @@ def _bloque_caminar(regla: Dict[str, Any], semana: int) -> Dict[str, Any]:
         "instrucciones": "Postura erguida, braceo natural. Mantén conversación cómoda."
     }
 
-def _bloque_pliometria(df: pd.DataFrame, regla: Dict[str, Any], semana: int) -> pd.DataFrame:
-    n = int(regla.get('n', 1))
-    return _elegir(df, {"tipo_ejercicio":"Pliometrico"}, n, semana)
-
-def _bloque_calentamiento(df: pd.DataFrame, regla: Dict[str, Any], semana: int) -> pd.DataFrame:
-    # Usa Movilidad por defecto; acepta tags/patrones de hombro/cadera/columna/core…
-    base = {
-        "tipo_ejercicio": regla.get("tipo_ejercicio","Movilidad"),
-        "patrones": regla.get("patrones", []),
-        "tags_incluye": regla.get("tags_incluye", ["movilidad"]),
-        "prioridad": regla.get("prioridad", None)
-    }
-    n = int(regla.get("n", 1))
-    sel = _elegir(df, base, n, semana)
-    if 'descanso' in sel.columns:
-        sel['descanso'] = 0
+def _bloque_pliometria(cat: Catalogo, bloque: BloqueCompilado, semana: int) -> _Items:
+    n = int(bloque.regla.get('n', 1))
+    return _elegir(cat, bloque.seleccion, n, semana)
+
+def _bloque_calentamiento(cat: Catalogo, bloque: BloqueCompilado, semana: int) -> _Items:
+    # bloque.seleccion: Movilidad por defecto + tags/patrones de la regla (ver reglas.compilar_bloque)
+    n = int(bloque.regla.get("n", 1))
+    sel = _elegir(cat, bloque.seleccion, n, semana)
+    if 'descanso' in sel.ajustes or 'descanso' in cat.columnas:
+        sel.ajustes['descanso'] = 0
     return sel
 
-def construir_bloque(df: pd.DataFrame, nombre: str, regla: Dict[str, Any], semana: int):
-    tipo = regla.get("tipo", "")
-    nom_low = nombre.lower()
-    if tipo.lower() == "circuitopar":
-        return {"tipo": nombre, "items": _construir_circuito_par(df, regla, semana)}
-    if tipo.lower() == "caminar":
+def _bloque(cat: Catalogo, bloque: BloqueCompilado, semana: int) -> Dict[str, Any]:
+    """Bloque con 'items' aún sin materializar (_Items)."""
+    nombre, regla = bloque.nombre, bloque.regla
+    if bloque.clase == "circuitopar":
+        return {"tipo": nombre, "items": _construir_circuito_par(cat, regla, semana)}
+    if bloque.clase == "caminar":
         return {"tipo": nombre, "plan": _bloque_caminar(regla, semana)}
-    if tipo.lower() == "carrera":
+    if bloque.clase == "carrera":
         plan = {"tipo": "Intervalos", "sesion": regla.get("sesion","6x400m Z4 rec 2'"), "indicaciones": "Calienta 10' + Enfría 10'"}
         return {"tipo": nombre, "plan": plan}
-    if tipo.lower() == "pliometrico":
-        return {"tipo": nombre, "items": _bloque_pliometria(df, regla, semana)}
-    if nom_low.startswith("calentamiento"):
-        return {"tipo": nombre, "items": _bloque_calentamiento(df, regla, semana)}
+    if bloque.clase == "pliometrico":
+        return {"tipo": nombre, "items": _bloque_pliometria(cat, bloque, semana)}
+    if bloque.clase == "calentamiento":
+        return {"tipo": nombre, "items": _bloque_calentamiento(cat, bloque, semana)}
     # Bloque genérico
-    items = _elegir(df, regla, int(regla.get('n',1)), semana)
+    items = _elegir(cat, bloque.seleccion, int(regla.get('n',1)), semana)
     return {"tipo": nombre, "items": items}
 
+def _materializar_bloques(cat: Catalogo, bloques: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    con_items = [b for b in bloques if "items" in b]
+    for b, items in zip(con_items, _materializar(cat, [b["items"] for b in con_items])):
+        b["items"] = items
+    return bloques
+
+def construir_bloque(df: pd.DataFrame | Catalogo, nombre: str, regla: Dict[str, Any] | BloqueCompilado, semana: int,
+                     rng: Optional[np.random.Generator] = None):
+    cat = como_catalogo(df)
+    bloque = regla if isinstance(regla, BloqueCompilado) else compilar_bloque(nombre, regla)
+    if bloque.nombre != nombre:
+        bloque = replace(bloque, nombre=nombre)
+    b = _bloque(cat, bloque, semana)
+    if "items" in b:
+        _sortear([b["items"]], rng if rng is not None else generador(semana))
+    return _materializar_bloques(cat, [b])[0]
+
 # ---------------- API pública ----------------
 
-def construir_sesion(df: pd.DataFrame, plantilla: Dict[str, Any], semana: int):
-    bloques = []
-    reglas = plantilla.get("reglas", {})
-    for bloque in plantilla.get("orden", []):
-        r = reglas.get(bloque, {})
-        bloques.append(construir_bloque(df, bloque, r, semana))
+DIAS = ["Lunes","Martes","Miércoles","Jueves","Viernes","Sábado","Domingo"]
+
+def construir_sesion(df: pd.DataFrame | Catalogo, plantilla: Dict[str, Any] | PlantillaCompilada, semana: int,
+                     rng: Optional[np.random.Generator] = None):
+    cat = como_catalogo(df)
+    plantilla = compilar_plantilla(plantilla)
+    bloques = [_bloque(cat, b, semana) for b in plantilla.bloques]
+    _sortear([b["items"] for b in bloques if "items" in b], rng if rng is not None else generador(semana))
+    # se copian las filas elegidas de todos los bloques una sola vez
+    return _materializar_bloques(cat, bloques)
+
+def _sorteo_dia(cat: Catalogo, pc: PatternsCompilados, dia: str, semana: int, semilla: int,
+                atleta: str) -> List[Dict[str, Any]]:
+    """Bloques del día con los items ya sorteados, sin materializar.
+
+    Cada bloque usa su propio Generator (generadores_dia), así que un día sale igual
+    pidiéndolo solo (plan_dia/plan_fecha) o dentro de plan_semana."""
+    bloques = [_bloque(cat, b, semana) for b in pc[dia].bloques]
+    rngs = generadores_dia(dia, len(bloques), semana, semilla, atleta)
+    con_items = [(b["items"], g) for b, g in zip(bloques, rngs) if "items" in b]
+    _sortear([it for it, _ in con_items], [g for _, g in con_items])
     return bloques
 
-def plan_dia(df: pd.DataFrame, patterns: Dict[str, Any], dia: str, semana_mesociclo: int = 1) -> Dict[str, Any]:
-    p = patterns.get(dia, {})
-    if not p:
+class PlanSemana(Mapping):
+    """Plan de lunes a domingo que genera cada día la primera vez que se pide.
+
+    Se usa como el dict de plan_semana (plan["Lunes"], items(), save_week...). Cada día se
+    sortea y se copian sus filas solo al pedirlo, y queda memorizado. Al serializarse con
+    pickle (p. ej. st.cache_data o multiprocessing) se genera entero y viaja como dict normal.
+    Recorrerlo da los siete días; una clave de la plantilla que no es un día (p. ej. "Extra")
+    se puede pedir igualmente (plan_dia), pero no se recorre.
+    """
+
+    def __init__(self, df: pd.DataFrame | Catalogo, patterns: Dict[str, Any], semana_mesociclo: int = 1,
+                 semilla: int = SEMILLA, atleta: str = ""):
+        self.cat = como_catalogo(df)
+        self.pc = compilar_patterns(patterns)
+        self.semana_mesociclo, self.semilla, self.atleta = semana_mesociclo, semilla, atleta
+        self._dias: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()   # puede compartirse entre hilos (caché de la app, write-behind)
+
+    def __getitem__(self, dia: str) -> Dict[str, Any]:
+        ses = self._dias.get(dia)
+        if ses is not None:
+            return ses
+        if dia not in DIAS and dia not in self.pc:
+            raise KeyError(dia)
+        with self._lock:
+            if dia not in self._dias:
+                self._dias[dia] = self._generar(dia)
+            return self._dias[dia]
+
+    def _generar(self, dia: str) -> Dict[str, Any]:
+        p = self.pc.get(dia)
+        if p is None:
+            return {"dia": dia, "bloques": []}
+        meta = p.meta if p.meta is not None else {}
+        bloques = _sorteo_dia(self.cat, self.pc, dia, self.semana_mesociclo, self.semilla, self.atleta)
+        return {"dia": dia, "meta": meta, "bloques": _materializar_bloques(self.cat, bloques)}
+
+    def __iter__(self):
+        return iter(DIAS)
+
+    def __len__(self) -> int:
+        return len(DIAS)
+
+    def generados(self) -> List[str]:
+        """Días ya generados, en orden de la semana."""
+        return [d for d in DIAS if d in self._dias]
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+    def __repr__(self) -> str:
+        return (f"PlanSemana(semana_mesociclo={self.semana_mesociclo}, atleta={self.atleta!r}, "
+                f"generados={self.generados()})")
+
+def plan_dia(df: pd.DataFrame | Catalogo, patterns: Dict[str, Any], dia: str, semana_mesociclo: int = 1,
+             semilla: int = SEMILLA, atleta: str = "") -> Dict[str, Any]:
+    if dia not in compilar_patterns(patterns):
         return {"dia": dia, "bloques": []}
-    return {"dia": dia, "meta": p.get("meta", {}), "bloques": construir_sesion(df, p, semana_mesociclo)}
+    return PlanSemana(df, patterns, semana_mesociclo, semilla, atleta)[dia]
+
+def plan_semana(df: pd.DataFrame | Catalogo, patterns: Dict[str, Any], semana_mesociclo: int = 1,
+                semilla: int = SEMILLA, atleta: str = "") -> Dict[str, Any]:
+    """Plan de lunes a domingo. Misma (semilla, atleta, semana) -> mismo plan.
 
-def plan_semana(df: pd.DataFrame, patterns: Dict[str, Any], semana_mesociclo: int = 1) -> Dict[str, Any]:
-    dias = ["Lunes","Martes","Miércoles","Jueves","Viernes","Sábado","Domingo"]
-    return {d: plan_dia(df, patterns, d, semana_mesociclo) for d in dias}
+    Genera los siete días; PlanSemana(...) da el mismo plan generando solo los días que se piden."""
+    return dict(PlanSemana(df, patterns, semana_mesociclo, semilla, atleta))
+
+def plan_mesociclo(df: pd.DataFrame | Catalogo, patterns: Dict[str, Any], semanas: int = 4,
+                   semilla: int = SEMILLA, atleta: str = "") -> Dict[int, Dict[str, Any]]:
+    cat = como_catalogo(df)
+    return {s: plan_semana(cat, patterns, s, semilla, atleta) for s in range(1, semanas + 1)}
 
 ##################################################
 
@@ -288,70 +488,96 @@ def plan_semana(df: pd.DataFrame, patterns: Dict[str, Any], semana_mesociclo: in
 
 from datetime import datetime, timedelta
 
-WEEKDAY_ES = ["Lunes","Martes","Miércoles","Jueves","Viernes","Sábado","Domingo"]
+WEEKDAY_ES = DIAS
 WEEKDAY_SHORT = ["Lun","Mar","Mié","Jue","Vie","Sáb","Dom"]
 
 def _weekday_name_es(fecha: datetime) -> str:
     return WEEKDAY_ES[fecha.weekday()]
 
-def plan_fecha(df: pd.DataFrame, patterns: Dict[str, Any], fecha: datetime, semana_mesociclo: int = 1) -> Dict[str, Any]:
-    """Plan de un día por fecha real, incluyendo meta.titulo (tipo de sesión)."""
-    dia_nombre = _weekday_name_es(fecha)
-    ses = plan_dia(df, patterns, dia_nombre, semana_mesociclo=semana_mesociclo)  # usa tu lógica actual
-    ses["fecha_iso"] = fecha.date().isoformat()
-    ses["dia_semana"] = WEEKDAY_SHORT[fecha.weekday()]
+def _sesion_fecha(ses: Dict[str, Any], fecha: datetime) -> Dict[str, Any]:
+    """Copia de la sesión con fecha_iso, dia_semana y meta.titulo (no toca la original)."""
+    ses = {**ses, "fecha_iso": fecha.date().isoformat(), "dia_semana": WEEKDAY_SHORT[fecha.weekday()]}
     # seguridad por si no hay meta
-    ses["meta"] = ses.get("meta", {}) or {}
-    ses["meta"]["titulo"] = ses["meta"].get("titulo", dia_nombre)
+    ses["meta"] = dict(ses.get("meta", {}) or {})
+    ses["meta"]["titulo"] = ses["meta"].get("titulo", _weekday_name_es(fecha))
     return ses
 
+def plan_fecha(df: pd.DataFrame | Catalogo, patterns: Dict[str, Any], fecha: datetime, semana_mesociclo: int = 1,
+               semilla: int = SEMILLA, atleta: str = "") -> Dict[str, Any]:
+    """Plan de un día por fecha real, incluyendo meta.titulo (tipo de sesión)."""
+    ses = plan_dia(df, patterns, _weekday_name_es(fecha), semana_mesociclo=semana_mesociclo,
+                   semilla=semilla, atleta=atleta)
+    return _sesion_fecha(ses, fecha)
+
+_COLS_ITEMS = ["id","ejercicio","categoria","series","repeticiones","RPE","descanso","tempo","superserie","orden"]
+_COLS_SESION = ["fecha","dia","tipo_sesion","bloque"]
+
+def _aplanar(sesiones: List[Dict[str, Any]]) -> Optional[pd.DataFrame]:
+    """Tabla plana de varias sesiones con un único concat (None si no hay nada que aplanar).
+
+    Cada bloque aporta sus items (o una fila 'detalle' si es un plan); fecha, dia, tipo_sesion
+    y bloque se rellenan después por columnas, repitiendo cada valor tantas filas como tenga."""
+    partes, filas, valores = [], [], []
+    for sesion in sesiones:
+        comunes = (sesion.get("fecha_iso", ""), sesion.get("dia_semana", ""),
+                   (sesion.get("meta") or {}).get("titulo", ""))
+        for bloque in sesion.get("bloques", []):
+            items = bloque.get("items")
+            # 1) Bloques con items (DataFrame de ejercicios)
+            if isinstance(items, pd.DataFrame) and not items.empty:
+                # columnas amables
+                parte = items[[c for c in _COLS_ITEMS if c in items.columns]]
+            # 2) Bloques con plan (p.ej. Caminar/Carrera)
+            elif isinstance(bloque.get("plan"), dict):
+                parte = pd.DataFrame({"detalle": ["; ".join([f"{k}: {v}" for k, v in bloque["plan"].items()])]})
+            # 3) Bloques vacíos: nada
+            else:
+                continue
+            partes.append(parte)
+            filas.append(len(parte))
+            valores.append((*comunes, bloque.get("tipo", "")))
+    if not partes:
+        return None
+    out = pd.concat(partes, ignore_index=True)
+    if "orden" in out.columns and isinstance(out["orden"].dtype, pd.Int64Dtype):
+        # mismo dtype que el aplanado fila a fila: float64 con NaN si hay huecos, int64 si no
+        out["orden"] = out["orden"].astype("float64" if out["orden"].isna().any() else "int64")
+    filas = np.asarray(filas)
+    for i, (col, vals) in enumerate(zip(_COLS_SESION, zip(*valores))):
+        out.insert(i, col, np.repeat(np.array(vals, dtype=object), filas))
+    return out
+
 def sesion_a_dataframe(sesion: Dict[str, Any]) -> pd.DataFrame:
     """Convierte la salida de plan_fecha/plan_dia a una tabla plana."""
-    rows = []
-    fecha_iso = sesion.get("fecha_iso", "")
-    dia_short = sesion.get("dia_semana", "")
-    tipo_sesion = (sesion.get("meta") or {}).get("titulo", "")
-
-    for bloque in sesion.get("bloques", []):
-        bloque_nombre = bloque.get("tipo", "")
-        # 1) Bloques con items (DataFrame de ejercicios)
-        if isinstance(bloque.get("items"), pd.DataFrame) and not bloque["items"].empty:
-            df_items = bloque["items"].copy()
-            # columnas amables
-            base_cols = [c for c in ["id","ejercicio","categoria","series","repeticiones","RPE","descanso","tempo","superserie","orden"] if c in df_items.columns]
-            for _, r in df_items[base_cols].iterrows():
-                rows.append({
-                    "fecha": fecha_iso,
-                    "dia": dia_short,
-                    "tipo_sesion": tipo_sesion,
-                    "bloque": bloque_nombre,
-                    **{k: r.get(k) for k in base_cols}
-                })
-        # 2) Bloques con plan (p.ej. Caminar/Carrera)
-        elif isinstance(bloque.get("plan"), dict):
-            p = bloque["plan"]
-            rows.append({
-                "fecha": fecha_iso,
-                "dia": dia_short,
-                "tipo_sesion": tipo_sesion,
-                "bloque": bloque_nombre,
-                "detalle": "; ".join([f"{k}: {v}" for k,v in p.items()])
-            })
-        # 3) Bloques vacíos: nada
-    if rows:
-        return pd.DataFrame(rows)
-    return pd.DataFrame(columns=["fecha","dia","tipo_sesion","bloque","id","ejercicio","categoria","series","repeticiones","RPE","descanso","tempo","superserie","orden","detalle"])
-
-def plan_rango_a_dataframe(df: pd.DataFrame, patterns: Dict[str, Any], start: datetime, days: int = 7, semana_mesociclo: int = 1) -> pd.DataFrame:
-    """Construye varias fechas seguidas y las aplana en una sola tabla."""
-    partes = []
+    out = _aplanar([sesion])
+    if out is not None:
+        return out
+    return pd.DataFrame(columns=[*_COLS_SESION, *_COLS_ITEMS, "detalle"])
+
+# Columnas de la tabla plana de un rango, en orden (plan_rango_a_dataframe deja solo las presentes)
+COLUMNAS_RANGO = ["fecha","dia","tipo_sesion","bloque","superserie","orden","id","ejercicio","categoria","series","repeticiones","RPE","descanso","tempo","detalle"]
+
+def iter_rango(df: pd.DataFrame | Catalogo, patterns: Dict[str, Any], start: datetime, days: int = 7, semana_mesociclo: int = 1,
+               semilla: int = SEMILLA, atleta: str = "") -> Iterator[pd.DataFrame]:
+    """Tabla plana de cada fecha del rango, día a día, sin acumularlas (ver exportar.py)."""
+    # todas las fechas comparten semana_mesociclo: un solo sorteo y cada día de la semana se
+    # genera y se aplana una vez; para el resto de fechas solo cambia la columna 'fecha'
+    semana = PlanSemana(df, patterns, semana_mesociclo, semilla, atleta)
+    planas: Dict[str, pd.DataFrame] = {}
     for i in range(days):
-        ses = plan_fecha(df, patterns, start + timedelta(days=i), semana_mesociclo=semana_mesociclo)
-        partes.append(sesion_a_dataframe(ses))
+        fecha = start + timedelta(days=i)
+        dia = _weekday_name_es(fecha)
+        if dia not in planas:
+            planas[dia] = sesion_a_dataframe(_sesion_fecha(semana[dia], fecha))
+        yield planas[dia].assign(fecha=fecha.date().isoformat())
+
+def plan_rango_a_dataframe(df: pd.DataFrame | Catalogo, patterns: Dict[str, Any], start: datetime, days: int = 7, semana_mesociclo: int = 1,
+                           semilla: int = SEMILLA, atleta: str = "") -> pd.DataFrame:
+    """Construye varias fechas seguidas y las aplana en una sola tabla."""
+    partes = list(iter_rango(df, patterns, start, days, semana_mesociclo, semilla, atleta))
     if partes:
         out = pd.concat(partes, ignore_index=True)
         # orden bonito
-        orden_cols = ["fecha","dia","tipo_sesion","bloque","superserie","orden","id","ejercicio","categoria","series","repeticiones","RPE","descanso","tempo","detalle"]
-        orden_cols = [c for c in orden_cols if c in out.columns]
+        orden_cols = [c for c in COLUMNAS_RANGO if c in out.columns]
         return out[orden_cols]
     return pd.DataFrame()
@@ -0,0 +1,236 @@
+# reglas.py – compila PATTERNS a predicados inmutables que ejecuta el planner
+from __future__ import annotations
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from dataclasses import dataclass, replace
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+from catalogo import Catalogo, IndiceCatalogo, como_catalogo, norm_texto
+
+# ---------------- Criterio de filtrado ----------------
+
+@dataclass(frozen=True)
+class Criterio:
+    """Parte filtrable de una regla, ya normalizada (minúsculas, prioridad entera).
+
+    None / tupla vacía = sin filtro. Es hashable, así que sirve de clave canónica de la regla.
+    """
+    tipo: Optional[str] = None
+    patrones: Tuple[str, ...] = ()
+    tags: Tuple[str, ...] = ()
+    prioridad: Optional[int] = None
+
+    @classmethod
+    def desde_dict(cls, regla: Dict[str, Any]) -> "Criterio":
+        tipo = regla.get("tipo_ejercicio")
+        prio = regla.get("prioridad")
+        try:
+            prio = int(prio) if prio is not None else None
+        except Exception:
+            prio = None  # si no convierte, ignoramos filtro de prioridad
+        return cls(
+            tipo=norm_texto(tipo) if tipo else None,
+            patrones=tuple(p.lower() for p in regla.get("patrones") or ()),
+            tags=tuple(t.lower() for t in regla.get("tags_incluye") or ()),
+            prioridad=prio,
+        )
+
+    def sin(self, *campos: str) -> "Criterio":
+        """Copia con los campos indicados relajados (sin filtro)."""
+        vacios = {"tipo": None, "patrones": (), "tags": (), "prioridad": None}
+        return replace(self, **{c: vacios[c] for c in campos})
+
+    def mascara(self, idx: IndiceCatalogo) -> Optional[np.ndarray]:
+        """Evalúa el criterio como máscara booleana sobre todo el catálogo.
+
+        Devuelve None si el filtro deja un DF sin columnas (un filtro de texto aplicado
+        sobre 0 filas siempre ha devuelto un DF vacío sin columnas).
+        """
+        m = np.ones(idx.n, dtype=bool)
+        if self.tipo is not None and idx.tiene_tipo:
+            m &= idx.mascara_tipo(self.tipo)
+        if self.patrones:
+            if not m.any():
+                return None
+            m &= idx.mascara_alguno(self.patrones)
+        if self.tags:
+            if not m.any():
+                return None
+            m &= idx.mascara_todos(self.tags)
+        if self.prioridad is not None and idx.tiene_prioridad:
+            m &= idx.mascara_prioridad(self.prioridad)
+        return m
+
+# ---------------- Reglas, bloques y plantillas compiladas ----------------
+
+@dataclass(frozen=True, eq=False)
+class ReglaCompilada:
+    params: Mapping[str, Any]
+    criterio: Criterio
+    parejas: Tuple[Tuple["ReglaCompilada", "ReglaCompilada"], ...] = ()
+
+    def get(self, clave: str, default: Any = None) -> Any:
+        return self.params.get(clave, default)
+
+@dataclass(frozen=True, eq=False)
+class BloqueCompilado:
+    nombre: str
+    clase: str                            # circuitopar | caminar | carrera | pliometrico | calentamiento | generico
+    regla: ReglaCompilada
+    seleccion: Optional[ReglaCompilada]   # regla que se pasa a _elegir (None en circuitos y cardio)
+
+@dataclass(frozen=True, eq=False)
+class PlantillaCompilada:
+    meta: Optional[Dict[str, Any]]        # el dict original (plan_dia lo devuelve tal cual)
+    bloques: Tuple[BloqueCompilado, ...]
+
+def compilar_regla(regla: Dict[str, Any] | ReglaCompilada) -> ReglaCompilada:
+    if isinstance(regla, ReglaCompilada):
+        return regla
+    parejas = tuple(
+        (compilar_regla(par[0]), compilar_regla(par[1]))
+        for par in regla.get("parejas", []) if len(par) == 2
+    )
+    return ReglaCompilada(MappingProxyType(dict(regla)), Criterio.desde_dict(regla), parejas)
+
+REGLA_PLIOMETRIA = compilar_regla({"tipo_ejercicio": "Pliometrico"})
+
+def _clase_bloque(nombre: str, regla: Dict[str, Any]) -> str:
+    tipo = regla.get("tipo", "").lower()
+    if tipo in ("circuitopar", "caminar", "carrera", "pliometrico"):
+        return tipo
+    if nombre.lower().startswith("calentamiento"):
+        return "calentamiento"
+    return "generico"
+
+def compilar_bloque(nombre: str, regla: Dict[str, Any] | ReglaCompilada) -> BloqueCompilado:
+    rc = compilar_regla(regla)
+    clase = _clase_bloque(nombre, rc.params)
+    if clase == "pliometrico":
+        seleccion = REGLA_PLIOMETRIA
+    elif clase == "calentamiento":
+        # Usa Movilidad por defecto; acepta tags/patrones de hombro/cadera/columna/core…
+        seleccion = compilar_regla({
+            "tipo_ejercicio": rc.get("tipo_ejercicio", "Movilidad"),
+            "patrones": rc.get("patrones", []),
+            "tags_incluye": rc.get("tags_incluye", ["movilidad"]),
+            "prioridad": rc.get("prioridad", None),
+        })
+    elif clase == "generico":
+        seleccion = rc
+    else:
+        seleccion = None
+    return BloqueCompilado(nombre, clase, rc, seleccion)
+
+def compilar_plantilla(plantilla: Dict[str, Any] | PlantillaCompilada) -> PlantillaCompilada:
+    if isinstance(plantilla, PlantillaCompilada):
+        return plantilla
+    reglas = plantilla.get("reglas", {})
+    return PlantillaCompilada(
+        plantilla.get("meta"),
+        tuple(compilar_bloque(b, reglas.get(b, {})) for b in plantilla.get("orden", [])),
+    )
+
+class PatternsCompilados(Mapping):
+    """PATTERNS compilado (dia -> PlantillaCompilada). Solo incluye días con plantilla."""
+
+    def __init__(self, fuente: Dict[str, Any]):
+        self.fuente = fuente
+        self._huella: Optional[str] = None
+        self._dias = {d: compilar_plantilla(p) for d, p in fuente.items() if p}
+
+    def __getitem__(self, dia: str) -> PlantillaCompilada:
+        return self._dias[dia]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._dias)
+
+    def __len__(self) -> int:
+        return len(self._dias)
+
+    @property
+    def huella(self) -> str:
+        """Hash estable del contenido de las plantillas (clave de caché de planes)."""
+        if self._huella is None:
+            texto = json.dumps(self.fuente, sort_keys=True, ensure_ascii=False, default=repr)
+            self._huella = hashlib.sha1(texto.encode("utf-8")).hexdigest()
+        return self._huella
+
+# Compilación memoizada por objeto: LRU acotado (se guarda la referencia para que el id no se
+# reutilice mientras está en la caché). Plantillas creadas al vuelo (por atleta, por trabajo)
+# solo ocupan hasta MAX_COMPILADOS entradas; quien reutiliza una plantilla muchas veces puede
+# compilarla una vez y pasar el PatternsCompilados. Si se modifica un dict de PATTERNS ya
+# compilado, hay que volver a compilarlo a mano.
+MAX_COMPILADOS = 64
+_COMPILADOS: "OrderedDict[int, Tuple[Dict[str, Any], PatternsCompilados]]" = OrderedDict()
+_COMPILADOS_LOCK = threading.Lock()
+
+def compilar_patterns(patterns: Dict[str, Any] | PatternsCompilados) -> PatternsCompilados:
+    if isinstance(patterns, PatternsCompilados):
+        return patterns
+    clave = id(patterns)
+    with _COMPILADOS_LOCK:
+        entrada = _COMPILADOS.get(clave)
+        if entrada is not None and entrada[0] is patterns:
+            _COMPILADOS.move_to_end(clave)
+            return entrada[1]
+    compilado = PatternsCompilados(patterns)
+    with _COMPILADOS_LOCK:
+        _COMPILADOS[clave] = (patterns, compilado)
+        _COMPILADOS.move_to_end(clave)
+        while len(_COMPILADOS) > MAX_COMPILADOS:
+            _COMPILADOS.popitem(last=False)
+    return compilado
+
+def huella_patterns(patterns: Dict[str, Any] | PatternsCompilados) -> str:
+    return compilar_patterns(patterns).huella
+
+# ---------------- Diagnóstico contra el catálogo ----------------
+
+class AvisoRegla(NamedTuple):
+    dia: str
+    bloque: str
+    lado: str      # "" en bloques simples, "pareja 1 · A/B" en CircuitoPar
+    motivo: str
+
+def _reglas_de_seleccion(bloque: BloqueCompilado) -> Iterator[Tuple[str, ReglaCompilada]]:
+    if bloque.seleccion is not None:
+        yield "", bloque.seleccion
+    for i, (a, b) in enumerate(bloque.regla.parejas, start=1):
+        yield f"pareja {i} · A", a
+        yield f"pareja {i} · B", b
+
+def _motivo(c: Criterio, idx: IndiceCatalogo) -> str:
+    sueltos = [
+        ("tipo", f"tipo_ejercicio '{c.tipo}' no existe en el catálogo"),
+        ("patrones", f"ningún patrón coincide: {list(c.patrones)}"),
+        ("tags", f"tags_incluye sin coincidencias: {list(c.tags)}"),
+        ("prioridad", f"no hay ejercicios con prioridad {c.prioridad}"),
+    ]
+    campos = ("tipo", "patrones", "tags", "prioridad")
+    for campo, texto in sueltos:
+        solo = c.sin(*[x for x in campos if x != campo])
+        m = solo.mascara(idx)
+        if solo != Criterio() and (m is None or not m.any()):
+            return texto
+    return "la combinación de filtros no tiene candidatos"
+
+def diagnosticar(df: pd.DataFrame | Catalogo, patterns: Dict[str, Any] | PatternsCompilados) -> List[AvisoRegla]:
+    """Reglas que nunca casan con el catálogo cargado (acabarían siempre en _fallback)."""
+    if df is None or df.empty:
+        return []
+    idx = como_catalogo(df).indice
+    avisos = []
+    for dia, plantilla in compilar_patterns(patterns).items():
+        for bloque in plantilla.bloques:
+            for lado, regla in _reglas_de_seleccion(bloque):
+                m = regla.criterio.mascara(idx)
+                if m is None or not m.any():
+                    avisos.append(AvisoRegla(dia, bloque.nombre, lado, _motivo(regla.criterio, idx)))
+    return avisos
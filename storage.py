@@ -1,8 +1,17 @@
 # storage.py (robusto)
-import os, json, math
+import os, json, math, hashlib, logging, struct, threading, zlib, atexit, contextlib, secrets
+from collections import OrderedDict
+from collections.abc import Mapping
 from datetime import date, timedelta
+import numpy as np
 import pandas as pd
-from typing import Any, Tuple, Optional
+from typing import Any, Callable, Dict, Tuple, Optional, Protocol
+try:
+    import fcntl
+except ImportError:         # Windows: el manifiesto solo se coordina entre hilos del proceso
+    fcntl = None
+
+log = logging.getLogger(__name__)
 
 BASE_DIR = os.path.join(os.getcwd(), "planes")  # o fija a una ruta absoluta si prefieres
 os.makedirs(BASE_DIR, exist_ok=True)
@@ -13,33 +22,94 @@ def week_monday(d: date) -> date:
 def label_from_date(d: date) -> str:
     return week_monday(d).strftime("%Y-%m-%d")
 
-def path_for_label(label: str) -> str:
-    return os.path.join(BASE_DIR, f"plan_{label}.json")
+# Formatos: "json" (legible, indent=2, por defecto) y "planz" (compacto, ver más abajo;
+# se elige al guardar o con PLANES_FORMAT=planz). Se leen los dos.
+JSON_EXT = ".json"
+PLANZ_EXT = ".planz"
+DEFAULT_FORMAT = "json"
+
+def path_for_label(label: str, formato: Optional[str] = None) -> str:
+    formato = formato or DEFAULT_FORMAT
+    return os.path.join(BASE_DIR, f"plan_{label}{PLANZ_EXT if formato == 'planz' else JSON_EXT}")
+
+def _mas_reciente(rutas) -> Optional[str]:
+    """De las rutas que existen, la escrita más tarde (None si no existe ninguna)."""
+    mejor, mejor_t = None, None
+    for ruta in rutas:
+        try:
+            t = os.stat(ruta).st_mtime_ns
+        except FileNotFoundError:
+            continue
+        if mejor_t is None or t > mejor_t:
+            mejor, mejor_t = ruta, t
+    return mejor
+
+def stored_path(label: str) -> str:
+    """Archivo guardado de la semana; con .json y .planz, el último escrito.
+
+    Si no hay ninguno, la ruta en DEFAULT_FORMAT.
+    """
+    return (_mas_reciente([path_for_label(label, "json"), path_for_label(label, "planz")])
+            or path_for_label(label))
 
 # ---------- helpers json-safe ----------
 
+def _nativo(v: Any) -> Any:
+    # escalares numpy dentro de columnas object / extension (lo que hace to_dict con ellos)
+    return v.item() if isinstance(v, (np.integer, np.floating, np.bool_)) else v
+
+def _columna_nativa(s: pd.Series) -> Optional[list]:
+    """Valores de la columna como tipos nativos de Python, en bloque; None si el dtype no se conoce.
+
+    Mismo resultado que to_dict(orient="records") celda a celda: los NaN de columnas float
+    y de texto ("str") se conservan como float('nan'), los nulos de Int64/string como pd.NA.
+    """
+    dt = s.dtype
+    if isinstance(dt, np.dtype):
+        if dt.kind in "biuf":
+            return s.to_numpy().tolist()            # int/float/bool nativos, sin mirar celda a celda
+        if dt.kind == "O":
+            return [_nativo(v) for v in s.to_numpy()]
+        return None                                 # fechas, etc.: camino general
+    if isinstance(dt, pd.StringDtype):
+        return list(s.array)                        # ya son str / na_value del dtype
+    if dt.kind in "biuf":                           # Int64, Float64, boolean (enmascarados)
+        if not s.hasnans:
+            return s.to_numpy(dtype=dt.numpy_dtype).tolist()
+        return [_nativo(v) for v in s.to_numpy(dtype=object)]
+    return None
+
+def _frame_records(df: pd.DataFrame) -> list:
+    """df.to_dict(orient="records") convirtiendo columna a columna en vez de fila a fila."""
+    cols = df.columns.tolist()
+    if not cols or len(set(cols)) != len(cols):
+        return df.to_dict(orient="records")
+    valores = []
+    for _, s in df.items():
+        v = _columna_nativa(s)
+        if v is None:
+            return df.to_dict(orient="records")
+        valores.append(v)
+    return [dict(zip(cols, fila)) for fila in zip(*valores)]
+
 def _to_json_safe(x: Any) -> Any:
     """Convierte recursivamente estructuras para que sean serializables en JSON."""
     # pandas DataFrame / Series
     if isinstance(x, pd.DataFrame):
-        return x.to_dict(orient="records")
+        return _frame_records(x)
     if isinstance(x, pd.Series):
         return x.to_dict()
 
-    # numpy / pandas scalars
-    try:
-        import numpy as np
-        if isinstance(x, (np.integer,)):
-            return int(x)
-        if isinstance(x, (np.floating,)):
-            # evitar NaN/Inf que arruinan el JSON legible
-            if math.isnan(float(x)) or math.isinf(float(x)):
-                return None
-            return float(x)
-        if isinstance(x, (np.bool_,)):
-            return bool(x)
-    except Exception:
-        pass
+    # numpy scalars
+    if isinstance(x, np.integer):
+        return int(x)
+    if isinstance(x, np.floating):
+        # evitar NaN/Inf que arruinan el JSON legible
+        if math.isnan(float(x)) or math.isinf(float(x)):
+            return None
+        return float(x)
+    if isinstance(x, np.bool_):
+        return bool(x)
 
     # tipos básicos
     if isinstance(x, (str, int, float, bool)) or x is None:
@@ -52,38 +122,559 @@ def _to_json_safe(x: Any) -> Any:
     if isinstance(x, (list, tuple, set)):
         return [_to_json_safe(v) for v in x]
 
-    # dict
-    if isinstance(x, dict):
+    # dict (y mappings como planner.PlanSemana, que así se genera entero)
+    if isinstance(x, Mapping):
         return {str(k): _to_json_safe(v) for k, v in x.items()}
 
     # fallback: representarlo como string
     return str(x)
 
+def _open_tmp(path: str) -> Tuple[int, str]:
+    """Crea un temporal con nombre único junto a 'path' (O_EXCL, modo 0666 menos la umask).
+
+    A diferencia de mkstemp (0600), los permisos salen como con open(): el kernel aplica la
+    umask del proceso, sin tener que leerla (os.umask la cambiaría para todos los hilos).
+    """
+    carpeta, nombre = os.path.split(path)
+    while True:
+        tmp = os.path.join(carpeta, f".{nombre}.{secrets.token_hex(6)}.tmp")
+        try:
+            return os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666), tmp
+        except FileExistsError:
+            continue
+
+def _atomic_write_bytes(data: bytes, path: str) -> None:
+    """Escribe en un temporal único del mismo directorio (con fsync) y lo renombra sobre 'path'.
+
+    El nombre único evita que dos procesos que guardan a la vez se pisen el temporal; empieza
+    por "." para que no parezca un plan al listar planes/.
+    """
+    fd, tmp = _open_tmp(path)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+        raise
+
+def _json_bytes(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+
 def _atomic_write_json(obj: Any, path: str) -> None:
-    tmp = f"{path}.tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(obj, f, ensure_ascii=False, indent=2)
-        f.flush()
-        os.fsync(f.fileno())
-    os.replace(tmp, path)
+    _atomic_write_bytes(_json_bytes(obj), path)
+
+# ---------- formato compacto (.planz) ----------
+# MAGIC + uint32 (big endian) con la longitud de la cabecera + cabecera JSON + un bloque zlib
+# por día. La cabecera tiene el orden de claves, lo que no es un día ("extra") y la tabla
+# {dia: offset, length, titulo}: leer un día es leer la cabecera y hacer un seek.
+# Dentro de cada día los items van por columnas: {"columnas": [...], "valores": [[...], ...]}.
+
+PLANZ_MAGIC = b"PLANZ\x00\x01\n"
+PLANZ_VERSION = 1
+
+def _is_day(v: Any) -> bool:
+    return isinstance(v, dict) and "bloques" in v
+
+def _items_to_columns(items: Any) -> Any:
+    if not items or not isinstance(items, list) or not all(isinstance(r, dict) for r in items):
+        return items
+    cols = list(items[0])
+    if any(list(r) != cols for r in items):
+        return items            # registros heterogéneos: se guardan tal cual
+    return {"columnas": cols, "valores": [[r[c] for r in items] for c in cols]}
+
+def _items_from_columns(items: Any) -> Any:
+    if isinstance(items, dict) and "columnas" in items:
+        return [dict(zip(items["columnas"], fila)) for fila in zip(*items["valores"])]
+    return items
+
+def _map_items(day: dict, fn) -> dict:
+    bloques = [{**b, "items": fn(b["items"])} if isinstance(b, dict) and "items" in b else b
+               for b in day.get("bloques") or []]
+    return {**day, "bloques": bloques}
+
+def _planz_bytes(safe: dict) -> bytes:
+    """Serializa un plan ya json-safe (salida de _to_json_safe) al formato .planz."""
+    blobs, table, extra, offset = [], {}, {}, 0
+    for k, v in safe.items():
+        if _is_day(v):
+            raw = json.dumps(_map_items(v, _items_to_columns), ensure_ascii=False, separators=(",", ":"))
+            blob = zlib.compress(raw.encode("utf-8"), 6)
+            table[k] = {"offset": offset, "length": len(blob),
+                        "titulo": (v.get("meta") or {}).get("titulo", "")}
+            blobs.append(blob)
+            offset += len(blob)
+        else:
+            extra[k] = v
+    header = json.dumps({"version": PLANZ_VERSION, "orden": list(safe), "dias": table, "extra": extra},
+                        ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return b"".join([PLANZ_MAGIC, struct.pack(">I", len(header)), header, *blobs])
+
+def _planz_read_header(f) -> Tuple[dict, int]:
+    """(cabecera, posición donde empiezan los días) de un .planz abierto en binario."""
+    if f.read(len(PLANZ_MAGIC)) != PLANZ_MAGIC:
+        raise ValueError("no es un archivo .planz")
+    (n,) = struct.unpack(">I", f.read(4))
+    header = json.loads(f.read(n).decode("utf-8"))
+    if header.get("version") != PLANZ_VERSION:
+        raise ValueError(f"versión .planz no soportada: {header.get('version')}")
+    return header, len(PLANZ_MAGIC) + 4 + n
+
+def _planz_read_day(f, start: int, entry: dict) -> dict:
+    f.seek(start + entry["offset"])
+    raw = zlib.decompress(f.read(entry["length"]))
+    return _map_items(json.loads(raw.decode("utf-8")), _items_from_columns)
+
+def _planz_load(path: str) -> dict:
+    with open(path, "rb") as f:
+        header, start = _planz_read_header(f)
+        days = {d: _planz_read_day(f, start, e) for d, e in header["dias"].items()}
+    return {k: days[k] if k in days else header["extra"][k] for k in header["orden"]}
+
+# ---------- manifiesto de planes ----------
+# planes/.manifest/planes.json guarda por label: archivo, tamaño, mtime_ns, sha256 y validez.
+# Va en un subdirectorio para que escribirlo no cambie el mtime de planes/: si ese mtime
+# coincide con el anotado, no se ha creado, borrado ni renombrado ningún plan y listar
+# no necesita os.listdir. Validar solo relee los archivos cuyo stat ha cambiado.
+
+MANIFEST_VERSION = 1
+_manifest_lock = threading.RLock()
+_manifest_depth = 0         # anidamiento de _manifest_locked en el hilo que tiene el RLock
+_manifest_cache: dict = {"path": None, "stat": None, "data": None}
+
+def _manifest_path() -> str:
+    return os.path.join(BASE_DIR, ".manifest", "planes.json")
+
+@contextlib.contextmanager
+def _manifest_locked():
+    """Exclusión sobre el manifiesto (leer, modificar, escribir): entre hilos con un RLock y
+    entre procesos (la app y un lote, varios workers) con flock sobre .manifest/planes.lock."""
+    global _manifest_depth
+    with _manifest_lock:
+        fd = None
+        if _manifest_depth == 0 and fcntl is not None:
+            lock_path = os.path.join(os.path.dirname(_manifest_path()), "planes.lock")
+            os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+            fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            except BaseException:
+                os.close(fd)
+                raise
+        _manifest_depth += 1
+        try:
+            yield
+        finally:
+            _manifest_depth -= 1
+            if fd is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+def _empty_manifest() -> dict:
+    return {"version": MANIFEST_VERSION, "dir_mtime_ns": None, "weeks": {}}
+
+def _load_manifest() -> dict:
+    """Manifiesto actual (se relee del disco solo si su stat cambió). Si falta o está corrupto, vacío."""
+    path = _manifest_path()
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return _empty_manifest()
+    key = (st.st_mtime_ns, st.st_size)
+    if _manifest_cache["path"] == path and _manifest_cache["stat"] == key:
+        return _manifest_cache["data"]
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != MANIFEST_VERSION or not isinstance(data.get("weeks"), dict):
+            raise ValueError("versión de manifiesto distinta")
+    except Exception:
+        data = _empty_manifest()
+    _manifest_cache.update(path=path, stat=key, data=data)
+    return data
+
+def _save_manifest(data: dict) -> None:
+    path = _manifest_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _atomic_write_bytes(json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), path)
+    st = os.stat(path)
+    _manifest_cache.update(path=path, stat=(st.st_mtime_ns, st.st_size), data=data)
+
+def _label_from_filename(name: str) -> Optional[str]:
+    for ext in (JSON_EXT, PLANZ_EXT):
+        if name.startswith("plan_") and name.endswith(ext):
+            return name[len("plan_"):-len(ext)]
+    return None
+
+def _entry(path: str, st: os.stat_result, data: Optional[bytes] = None) -> dict:
+    """Entrada del manifiesto. 'sha256' es el del contenido cuya validez está anotada."""
+    e = {"file": os.path.basename(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+         "sha256": None, "valid": None, "error": None}
+    if data is not None:
+        e["sha256"] = hashlib.sha256(data).hexdigest()
+    return e
+
+def _sync_manifest(stat_files: bool = False) -> dict:
+    """Pone el manifiesto al día con planes/ y lo devuelve.
+
+    - Si el mtime del directorio cambió: listdir (altas y bajas de archivos).
+    - Con stat_files: stat de cada plan; los que cambiaron quedan pendientes de validar.
+    """
+    with _manifest_locked():
+        m = _load_manifest()
+        weeks = m["weeks"]
+        changed = False
+        dir_mtime = os.stat(BASE_DIR).st_mtime_ns
+        if m["dir_mtime_ns"] != dir_mtime:
+            present = {}
+            for name in os.listdir(BASE_DIR):
+                label = _label_from_filename(name)
+                if label is not None:
+                    present.setdefault(label, []).append(os.path.join(BASE_DIR, name))
+            # con .json y .planz de la misma semana, cuenta el último escrito (como stored_path)
+            present = {l: p[0] if len(p) == 1 else _mas_reciente(p) for l, p in present.items()}
+            present = {l: p for l, p in present.items() if p is not None}
+            for label in [l for l in weeks if l not in present]:
+                del weeks[label]
+            for label, path in present.items():
+                if label not in weeks or weeks[label]["file"] != os.path.basename(path):
+                    try:
+                        weeks[label] = _entry(path, os.stat(path))
+                    except FileNotFoundError:
+                        continue
+            m["dir_mtime_ns"] = dir_mtime
+            changed = True
+        if stat_files:
+            for label, e in list(weeks.items()):
+                try:
+                    st = os.stat(os.path.join(BASE_DIR, e["file"]))
+                except FileNotFoundError:
+                    del weeks[label]
+                    changed = True
+                    continue
+                if (st.st_size, st.st_mtime_ns) != (e["size"], e["mtime_ns"]):
+                    e.update(size=st.st_size, mtime_ns=st.st_mtime_ns, valid=None)
+                    changed = True
+        if changed:
+            _save_manifest(m)
+        return m
+
+def _validate_entry(label: str, e: dict) -> None:
+    """Relee el archivo: si el hash coincide con el anotado, conserva la validez; si no, lo parsea."""
+    try:
+        path = os.path.join(BASE_DIR, e["file"])
+        with open(path, "rb") as f:
+            data = f.read()
+    except Exception as ex:
+        e.update(valid=False, error=f"{type(ex).__name__}: {ex}")
+        return
+    sha = hashlib.sha256(data).hexdigest()
+    if sha == e["sha256"]:          # mismo contenido ya validado (p. ej. solo cambió el mtime)
+        e["valid"] = e["error"] is None
+        return
+    try:
+        if path.endswith(PLANZ_EXT):
+            _planz_load(path)
+        else:
+            json.loads(data.decode("utf-8"))
+        e.update(valid=True, error=None)
+    except Exception as ex:
+        e.update(valid=False, error=f"{type(ex).__name__}: {ex}")
+    e["sha256"] = sha
+
+def rebuild_manifest() -> dict:
+    """Descarta el manifiesto y lo reconstruye desde planes/ (validez pendiente)."""
+    with _manifest_locked():
+        _save_manifest(_empty_manifest())
+        return _sync_manifest()
+
+def _serialize(plan: dict, formato: str) -> Tuple[dict, bytes]:
+    safe = _to_json_safe(plan)
+    return safe, (_planz_bytes(safe) if formato == "planz" else _json_bytes(safe))
+
+# ---------- hooks de guardado ----------
+# Funciones fn(label, plan_json_safe, huella) que se llaman tras cada guardado correcto
+# (p. ej. analitica.py mantiene agregados incrementales). 'huella' identifica la versión
+# guardada (tamaño:mtime en archivos); un hook que falla no afecta al guardado.
+
+_save_hooks: list = []
+
+def add_save_hook(fn: Callable[[str, dict, str], None]) -> None:
+    if fn not in _save_hooks:
+        _save_hooks.append(fn)
+
+def remove_save_hook(fn: Callable[[str, dict, str], None]) -> None:
+    if fn in _save_hooks:
+        _save_hooks.remove(fn)
+
+def _run_save_hooks(label: str, safe: dict, huella: str) -> None:
+    for fn in list(_save_hooks):
+        try:
+            fn(label, safe, huella)
+        except Exception:
+            log.exception("Fallo en hook de guardado para %s", label)
+
+def _fingerprint(e: dict) -> str:
+    return f"{e['size']}:{e['mtime_ns']}"
+
+def _fsync_dir(path: str) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return                  # p. ej. Windows: no se pueden abrir directorios
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def _commit_weeks(batch: list) -> list:
+    """Escribe [(label, formato, plan_json_safe, bytes)] y devuelve [(label, ruta, error)].
+
+    Cada archivo va a un temporal con fsync y luego os.replace; el fsync del directorio y la
+    escritura del manifiesto se hacen una vez para todo el lote. Un archivo que falla no
+    impide los demás: 'error' es la excepción (None si quedó en disco) y el manifiesto
+    recoge los que sí se escribieron.
+    """
+    results, saved = [], []
+    with _manifest_locked():
+        dir_before = os.stat(BASE_DIR).st_mtime_ns
+        m = _load_manifest()
+        for label, formato, safe, data in batch:
+            path = path_for_label(label, formato)
+            try:
+                _atomic_write_bytes(data, path)
+            except Exception as e:
+                results.append((label, path, e))
+                continue
+            e = _entry(path, os.stat(path), data)
+            e["valid"] = True       # lo acabamos de serializar nosotros
+            m["weeks"][label] = e
+            results.append((label, path, None))
+            saved.append((label, safe, _fingerprint(e)))
+        if saved:
+            try:
+                _fsync_dir(BASE_DIR)
+                # si el manifiesto estaba al día con el directorio, sigue estándolo tras el lote
+                if m["dir_mtime_ns"] == dir_before:
+                    m["dir_mtime_ns"] = os.stat(BASE_DIR).st_mtime_ns
+                _save_manifest(m)
+            except OSError:
+                # los planes ya están en disco: el manifiesto se rehará al listar
+                log.exception("No se pudo actualizar el manifiesto de planes")
+    for label, safe, huella in saved:
+        _run_save_hooks(label, safe, huella)
+    return results
+
+# ---------- escritura diferida (write-behind) ----------
+# Opcional (configure_write_behind): save_week encola y vuelve al momento; un hilo escribe
+# por lotes. Guardar dos veces la misma semana antes de que se escriba deja solo la última.
+# Las lecturas de una semana pendiente esperan a que se escriba (se lee lo último guardado).
+
+MAX_SAVE_STATUS = 1024      # estados terminados (saved/error) que se recuerdan para save_status
+
+class _WriteBehind:
+    def __init__(self, maxsize: int = 64):
+        self.maxsize = maxsize
+        self.cond = threading.Condition()
+        self.pending: Dict[str, Tuple[dict, str]] = {}     # label -> (plan, formato), orden FIFO
+        self.writing: set = set()
+        # label -> estado; los terminados van al final y se olvidan los más antiguos
+        self.status: "OrderedDict[str, dict]" = OrderedDict()
+        self.stats = {"queued": 0, "coalesced": 0, "written": 0, "errors": 0, "batches": 0}
+        self.stopping = False
+        self.thread = threading.Thread(target=self._run, name="storage-write-behind", daemon=True)
+        self.thread.start()
+
+    def submit(self, plan: dict, label: str, formato: str) -> None:
+        with self.cond:
+            if self.stopping:
+                raise RuntimeError("write-behind detenido")
+            # cola acotada: si está llena, el que guarda espera (salvo que solo sustituya)
+            while len(self.pending) >= self.maxsize and label not in self.pending:
+                self.cond.wait()
+            if label in self.pending:
+                self.stats["coalesced"] += 1
+                del self.pending[label]         # se vuelve a poner al final con el plan nuevo
+            self.pending[label] = (plan, formato)
+            self.stats["queued"] += 1
+            self.status[label] = {"state": "queued", "path": path_for_label(label, formato), "error": None}
+            self.cond.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self.cond:
+                while not self.pending and not self.stopping:
+                    self.cond.wait()
+                if not self.pending and self.stopping:
+                    return
+                batch = list(self.pending.items())
+                self.pending.clear()
+                self.writing.update(label for label, _ in batch)
+                for label, _ in batch:
+                    self.status[label]["state"] = "writing"
+                self.cond.notify_all()
+            results = {}
+            data = []
+            for label, (plan, formato) in batch:
+                try:
+                    data.append((label, formato, *_serialize(plan, formato)))
+                except Exception as e:
+                    results[label] = f"{type(e).__name__}: {e}"
+            try:
+                for label, _path, err in _commit_weeks(data):
+                    if err is not None:
+                        results[label] = f"{type(err).__name__}: {err}"
+            except Exception as e:
+                # falla antes de escribir ningún archivo (p. ej. planes/ no existe)
+                for label, *_ in data:
+                    results[label] = f"{type(e).__name__}: {e}"
+            with self.cond:
+                self.stats["batches"] += 1
+                for label, _ in batch:
+                    self.writing.discard(label)
+                    err = results.get(label)
+                    self.stats["errors" if err else "written"] += 1
+                    if label not in self.pending:   # si se volvió a encolar, manda ese estado
+                        self.status[label].update(state="error" if err else "saved", error=err)
+                        self.status.move_to_end(label)
+                self._podar_status()
+                self.cond.notify_all()
+
+    def _podar_status(self) -> None:
+        # con self.cond tomado; nunca se olvida una semana en cola o escribiéndose
+        sobran = len(self.status) - MAX_SAVE_STATUS
+        for label in list(self.status):
+            if sobran <= 0:
+                break
+            if label not in self.pending and label not in self.writing:
+                del self.status[label]
+                sobran -= 1
+
+    def wait(self, label: Optional[str] = None, timeout: Optional[float] = None) -> bool:
+        """Espera a que se escriba 'label' (o todo si es None). False si vence el timeout."""
+        def done():
+            if label is None:
+                return not self.pending and not self.writing
+            return label not in self.pending and label not in self.writing
+        with self.cond:
+            return self.cond.wait_for(done, timeout)
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        ok = self.wait(timeout=timeout)
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+        self.thread.join(timeout)
+        return ok
+
+_write_behind: Optional[_WriteBehind] = None
+_write_behind_lock = threading.Lock()
+
+def configure_write_behind(enabled: bool = True, maxsize: int = 64) -> None:
+    """Activa/desactiva la escritura diferida de save_week. Al desactivar se vacía la cola."""
+    global _write_behind
+    with _write_behind_lock:
+        if enabled and _write_behind is None:
+            _write_behind = _WriteBehind(maxsize)
+        elif enabled:
+            _write_behind.maxsize = maxsize
+        elif _write_behind is not None:
+            _write_behind.stop()
+            _write_behind = None
+
+def flush_saves(timeout: Optional[float] = None) -> bool:
+    """Espera a que se escriban todos los guardados pendientes. False si vence el timeout."""
+    wb = _write_behind
+    return wb.wait(timeout=timeout) if wb is not None else True
+
+def save_status(label: str) -> Optional[dict]:
+    """Estado del último guardado diferido de 'label': {"state", "path", "error"}.
+
+    state: queued | writing | saved | error. None si no pasó por la cola (o si es de los
+    guardados terminados más antiguos: se recuerdan los últimos MAX_SAVE_STATUS).
+    """
+    wb = _write_behind
+    if wb is None:
+        return None
+    with wb.cond:
+        st = wb.status.get(label)
+        return dict(st) if st else None
+
+def write_behind_stats() -> Dict[str, int]:
+    wb = _write_behind
+    if wb is None:
+        return {}
+    with wb.cond:
+        return {**wb.stats, "pending": len(wb.pending), "writing": len(wb.writing)}
+
+def _wait_pending(label: Optional[str] = None) -> None:
+    wb = _write_behind
+    if wb is not None:
+        wb.wait(label)
+
+@atexit.register
+def _flush_on_exit() -> None:
+    if _write_behind is not None:
+        _write_behind.stop()
 
 # ---------- API ----------
 
-def save_week(plan: dict, label: Optional[str] = None) -> str:
-    """Guarda el plan semanal convirtiendo a JSON-serializable y usando escritura atómica."""
+def save_week(plan: dict, label: Optional[str] = None, formato: Optional[str] = None) -> str:
+    """Guarda el plan semanal convirtiendo a JSON-serializable y usando escritura atómica.
+
+    formato: "json" (legible) o "planz" (compacto); por defecto DEFAULT_FORMAT. Si la semana
+    ya estaba guardada en el otro formato, ese archivo no se toca: se lee el último escrito.
+    Con write-behind activo solo encola (el plan no debe modificarse después) y devuelve
+    la ruta final; save_status(label) indica cuándo está en disco.
+    """
     if label is None:
         label = label_from_date(date.today())
-    path = path_for_label(label)
-    safe = _to_json_safe(plan)
-    _atomic_write_json(safe, path)
+    formato = formato or DEFAULT_FORMAT
+    wb = _write_behind
+    if wb is not None:
+        wb.submit(plan, label, formato)
+        return path_for_label(label, formato)
+    _, path, error = _commit_weeks([(label, formato, *_serialize(plan, formato))])[0]
+    if error is not None:
+        raise error
     return path
 
 def load_week(label: str) -> dict:
     """Carga un plan. Lanza JSONDecodeError con detalle si el archivo está corrupto."""
-    path = path_for_label(label)
+    _wait_pending(label)
+    path = stored_path(label)
+    if path.endswith(PLANZ_EXT):
+        return _planz_load(path)
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
+def load_week_index(label: str) -> Dict[str, str]:
+    """{dia: titulo} de la semana guardada, sin decodificar los días (en .planz)."""
+    _wait_pending(label)
+    path = stored_path(label)
+    if path.endswith(PLANZ_EXT):
+        with open(path, "rb") as f:
+            header, _ = _planz_read_header(f)
+        return {d: e["titulo"] for d, e in header["dias"].items()}
+    return {k: (v.get("meta") or {}).get("titulo", "") for k, v in load_week(label).items() if _is_day(v)}
+
+def load_day(label: str, dia: str) -> dict:
+    """Un solo día de la semana guardada ({} si no existe). En .planz solo se lee ese día."""
+    _wait_pending(label)
+    path = stored_path(label)
+    if path.endswith(PLANZ_EXT):
+        with open(path, "rb") as f:
+            header, start = _planz_read_header(f)
+            entry = header["dias"].get(dia)
+            return _planz_read_day(f, start, entry) if entry else {}
+    return load_week(label).get(dia, {})
+
 def try_load_week(label: str) -> Tuple[Optional[dict], Optional[str]]:
     """Versión segura: no lanza; devuelve (plan, error_str)."""
     try:
@@ -92,31 +683,126 @@ def try_load_week(label: str) -> Tuple[Optional[dict], Optional[str]]:
         return None, f"{type(e).__name__}: {e}"
 
 def list_weeks() -> list[str]:
-    files = [f for f in os.listdir(BASE_DIR) if f.startswith("plan_") and f.endswith(".json")]
-    labels = [f.replace("plan_", "").replace(".json", "") for f in files]
-    labels.sort(reverse=True)
-    return labels
+    """Labels guardados (más reciente primero), desde el manifiesto + los pendientes de escribir."""
+    labels = set(_sync_manifest()["weeks"])
+    wb = _write_behind
+    if wb is not None:
+        with wb.cond:
+            labels.update(wb.pending, wb.writing)
+    return sorted(labels, reverse=True)
+
+def week_fingerprints() -> Dict[str, str]:
+    """{label: "tamaño:mtime_ns"} de las semanas guardadas; cambia si se reescribe el archivo.
+
+    No espera a la escritura diferida: lo pendiente aún no está (los hooks lo avisarán).
+    """
+    return {l: _fingerprint(e) for l, e in _sync_manifest(stat_files=True)["weeks"].items()}
 
 def list_invalid_weeks() -> list[Tuple[str, str]]:
-    """Devuelve [(label, error)] para los JSON que no se pueden leer."""
-    bad = []
-    for label in list_weeks():
-        _, err = try_load_week(label)
-        if err:
-            bad.append((label, err))
-    return bad
-
-def ensure_autogen_today(plan_builder) -> tuple[bool, str | None]:
+    """Devuelve [(label, error)] para los JSON que no se pueden leer.
+
+    Solo se releen los archivos nuevos o cuyo tamaño/mtime cambió desde la última validación.
+    """
+    _wait_pending()
+    with _manifest_locked():
+        m = _sync_manifest(stat_files=True)
+        pending = [(l, e) for l, e in m["weeks"].items() if e["valid"] is None]
+        for label, e in pending:
+            _validate_entry(label, e)
+        if pending:
+            _save_manifest(m)
+        return [(l, m["weeks"][l]["error"]) for l in sorted(m["weeks"], reverse=True)
+                if not m["weeks"][l]["valid"]]
+
+# ---------- backends ----------
+# Interfaz común para guardar/leer semanas. El backend por defecto es el de archivos (las
+# funciones de arriba); storage_sqlite.SQLiteBackend guarda en tablas indexadas.
+# Se elige con set_backend() o con la variable de entorno PLANES_BACKEND=sqlite (PLANES_DB).
+# Opcional, para guardar muchos planes de golpe (lote.py): 'formato' (bytes que espera el
+# backend, None si no usa) y save_weeks([(label, plan_json_safe, bytes)]) -> [(label, ruta,
+# error)], que escribe todo el lote de una vez. Sin ellos se usa save_week plan a plan.
+
+class StorageBackend(Protocol):
+    def save_week(self, plan: dict, label: Optional[str] = None) -> str: ...
+    def load_week(self, label: str) -> dict: ...
+    def load_day(self, label: str, dia: str) -> dict: ...
+    def load_week_index(self, label: str) -> Dict[str, str]: ...
+    def list_weeks(self) -> list[str]: ...
+    def fingerprints(self) -> Dict[str, str]: ...
+    def marca(self) -> Any: ...
+
+class FileBackend:
+    """Un archivo por semana en BASE_DIR (.json o .planz; formato None = DEFAULT_FORMAT)."""
+
+    def __init__(self, formato: Optional[str] = None):
+        self.formato = formato or DEFAULT_FORMAT
+
+    def save_week(self, plan: dict, label: Optional[str] = None) -> str:
+        return save_week(plan, label, self.formato)
+
+    def save_weeks(self, lote: list) -> list:
+        """Guarda [(label, plan_json_safe, bytes en self.formato)]: un fsync de directorio y una
+        escritura del manifiesto para todo el lote. Devuelve [(label, ruta, error)]."""
+        if _write_behind is not None:
+            # respeta el orden con lo ya encolado: el lote pasa también por la cola
+            return [(label, save_week(safe, label, self.formato), None) for label, safe, _ in lote]
+        return _commit_weeks([(label, self.formato, safe, data) for label, safe, data in lote])
+
+    def load_week(self, label: str) -> dict:
+        return load_week(label)
+
+    def load_day(self, label: str, dia: str) -> dict:
+        return load_day(label, dia)
+
+    def load_week_index(self, label: str) -> Dict[str, str]:
+        return load_week_index(label)
+
+    def list_weeks(self) -> list[str]:
+        return list_weeks()
+
+    def fingerprints(self) -> Dict[str, str]:
+        """{label: huella} de todas las semanas (stat de cada archivo, sin leerlos)."""
+        return week_fingerprints()
+
+    def marca(self) -> int:
+        """Cambia cuando se crea, borra o reescribe (os.replace) un plan: un solo stat de planes/."""
+        return os.stat(BASE_DIR).st_mtime_ns
+
+_backend: Optional[StorageBackend] = None
+
+def set_backend(backend: StorageBackend) -> None:
+    global _backend
+    _backend = backend
+
+def get_backend() -> StorageBackend:
+    """Backend activo (por defecto FileBackend, o el indicado en PLANES_BACKEND).
+
+    Con archivos, PLANES_FORMAT=planz guarda en el formato compacto.
+    """
+    global _backend
+    if _backend is None:
+        if os.environ.get("PLANES_BACKEND", "").lower() == "sqlite":
+            from storage_sqlite import SQLiteBackend
+            _backend = SQLiteBackend(os.environ.get("PLANES_DB", "planes.db"))
+        else:
+            _backend = FileBackend(os.environ.get("PLANES_FORMAT") or None)
+    return _backend
+
+def ensure_autogen_today(plan_builder, backend: Optional[StorageBackend] = None) -> tuple[bool, str | None]:
     """Si hoy es sábado, genera el plan del lunes próximo si no existe."""
+    backend = backend or get_backend()
     today = date.today()
     created = False
     label = None
     if today.weekday() == 5:  # sábado
         next_monday = week_monday(today + timedelta(days=2))
         label = label_from_date(next_monday)
-        plan, err = try_load_week(label)
+        try:
+            plan = backend.load_week(label)
+        except Exception:
+            plan = None
         if plan is None:  # no existe o corrupto
             safe_plan = plan_builder()
-            save_week(safe_plan, label)
+            backend.save_week(safe_plan, label)
             created = True
     return created, label
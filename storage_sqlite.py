@@ -0,0 +1,364 @@
+# storage_sqlite.py – backend SQLite para las semanas guardadas (tablas normalizadas e indexadas)
+#
+# Uso como backend:   storage.set_backend(SQLiteBackend("planes.db"))  o  PLANES_BACKEND=sqlite
+# Migrar planes/:     python storage_sqlite.py --db planes.db [--planes planes]
+#
+# Cada semana se reparte en semanas / dias / bloques / items. Los registros completos se guardan
+# también como JSON (columna 'datos') para que load_week devuelva exactamente lo mismo que el
+# backend de archivos; las columnas sueltas (lunes, fecha, ejercicio…) son las que se consultan.
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import storage
+from storage import _to_json_safe, label_from_date
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS semanas (
+    label    TEXT PRIMARY KEY,
+    lunes    TEXT,               -- YYYY-MM-DD si el label empieza por una fecha
+    guardado TEXT NOT NULL,      -- fecha/hora ISO de la última escritura
+    huella   TEXT NOT NULL,      -- sha1 del plan guardado (identifica la versión)
+    cabecera TEXT NOT NULL       -- JSON: orden de claves + claves que no son días
+);
+CREATE TABLE IF NOT EXISTS dias (
+    semana TEXT NOT NULL REFERENCES semanas(label) ON DELETE CASCADE,
+    dia    TEXT NOT NULL,
+    pos    INTEGER NOT NULL,
+    fecha  TEXT,
+    titulo TEXT,
+    datos  TEXT NOT NULL,        -- JSON del día con "bloques": null
+    PRIMARY KEY (semana, dia)
+);
+CREATE TABLE IF NOT EXISTS bloques (
+    id     INTEGER PRIMARY KEY,
+    semana TEXT NOT NULL,
+    dia    TEXT NOT NULL,
+    pos    INTEGER NOT NULL,
+    tipo   TEXT,
+    items_aparte INTEGER NOT NULL DEFAULT 0,   -- 1: los items están en la tabla items
+    datos  TEXT NOT NULL,        -- JSON del bloque (con "items": null si van aparte)
+    FOREIGN KEY (semana, dia) REFERENCES dias(semana, dia) ON DELETE CASCADE
+);
+CREATE TABLE IF NOT EXISTS items (
+    bloque         INTEGER NOT NULL REFERENCES bloques(id) ON DELETE CASCADE,
+    pos            INTEGER NOT NULL,
+    ejercicio_id   INTEGER,
+    ejercicio      TEXT,
+    ejercicio_norm TEXT,         -- minúsculas, sin espacios extremos (búsquedas)
+    categoria      TEXT,
+    tipo_ejercicio TEXT,
+    series         TEXT,
+    repeticiones   TEXT,
+    rpe            TEXT,
+    superserie     TEXT,
+    datos          TEXT NOT NULL,
+    PRIMARY KEY (bloque, pos)
+);
+CREATE INDEX IF NOT EXISTS ix_semanas_lunes ON semanas(lunes);
+CREATE INDEX IF NOT EXISTS ix_dias_fecha ON dias(fecha);
+CREATE INDEX IF NOT EXISTS ix_bloques_dia ON bloques(semana, dia, pos);
+CREATE INDEX IF NOT EXISTS ix_items_ejercicio ON items(ejercicio_norm);
+CREATE INDEX IF NOT EXISTS ix_items_ejercicio_id ON items(ejercicio_id);
+-- nombres distintos (ejercicio_norm) que han aparecido: las búsquedas por texto se resuelven
+-- aquí (tamaño del catálogo, no del historial) y luego van por ix_items_ejercicio
+CREATE TABLE IF NOT EXISTS ejercicios (
+    norm TEXT PRIMARY KEY
+);
+"""
+
+# Índice de subcadenas sobre los nombres (FTS5 con tokenizador trigram, SQLite >= 3.34). Si la
+# compilación de SQLite no lo tiene, se busca recorriendo la tabla ejercicios.
+ESQUEMA_FTS = """
+CREATE VIRTUAL TABLE ejercicios_fts USING fts5(norm, content='ejercicios', content_rowid='rowid',
+                                               tokenize='trigram');
+CREATE TRIGGER ejercicios_fts_ai AFTER INSERT ON ejercicios BEGIN
+    INSERT INTO ejercicios_fts (rowid, norm) VALUES (new.rowid, new.norm);
+END;
+INSERT INTO ejercicios_fts (ejercicios_fts) VALUES ('rebuild');
+"""
+VERSION_ESQUEMA = 1     # PRAGMA user_version: 1 = tabla ejercicios rellenada desde items
+
+DIAS = ["Lunes","Martes","Miércoles","Jueves","Viernes","Sábado","Domingo"]
+
+def _json(x: Any) -> str:
+    return json.dumps(x, ensure_ascii=False, separators=(",", ":"))
+
+def _lunes(label: str) -> Optional[date]:
+    try:
+        return datetime.strptime(label[:10], "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+def _texto(v: Any) -> Optional[str]:
+    return None if v is None else str(v)
+
+def _entero(v: Any) -> Optional[int]:
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        return None
+
+def _normalizables(items: Any) -> bool:
+    return isinstance(items, list) and all(isinstance(r, dict) for r in items)
+
+class SQLiteBackend:
+    """Backend de almacenamiento en un fichero SQLite (misma interfaz que storage.FileBackend)."""
+
+    formato = None      # guarda el plan json-safe en tablas: no usa bytes serializados
+
+    def __init__(self, ruta: str = "planes.db"):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(ruta, check_same_thread=False)
+        self._con.execute("PRAGMA foreign_keys = ON")
+        self._con.execute("PRAGMA journal_mode = WAL")
+        self._con.executescript(ESQUEMA)
+        self._preparar_busqueda()
+
+    def _preparar_busqueda(self) -> None:
+        with self._con:
+            if self._con.execute("PRAGMA user_version").fetchone()[0] < VERSION_ESQUEMA:
+                # bases creadas antes de existir la tabla ejercicios
+                self._con.execute("INSERT OR IGNORE INTO ejercicios (norm) SELECT DISTINCT ejercicio_norm"
+                                  " FROM items WHERE ejercicio_norm IS NOT NULL")
+                self._con.execute(f"PRAGMA user_version = {VERSION_ESQUEMA}")
+        if not self._tiene_fts():
+            try:
+                self._con.executescript("BEGIN;" + ESQUEMA_FTS + "COMMIT;")
+            except sqlite3.OperationalError:    # sin fts5/trigram, o la creó otro proceso a la vez
+                if self._con.in_transaction:
+                    self._con.rollback()
+        self._fts = self._tiene_fts()
+
+    def _tiene_fts(self) -> bool:
+        return self._con.execute("SELECT 1 FROM sqlite_master WHERE name = 'ejercicios_fts'").fetchone() is not None
+
+    def close(self) -> None:
+        with self._lock:
+            self._con.close()
+
+    # ---------------- escritura ----------------
+
+    def save_week(self, plan: dict, label: Optional[str] = None) -> str:
+        """Guarda (o sustituye) la semana en una sola transacción."""
+        if label is None:
+            label = label_from_date(date.today())
+        return self._guardar(_to_json_safe(plan), label)
+
+    def save_weeks(self, lote: list) -> list:
+        """Guarda [(label, plan_json_safe, _)] en una sola transacción; devuelve [(label, ruta, error)].
+
+        Si alguna semana falla se deshace el lote y se guardan una a una (así solo falla esa).
+        """
+        try:
+            with self._lock, self._con:
+                cur = self._con.cursor()
+                huellas = [self._insertar_semana(cur, safe, label) for label, safe, _ in lote]
+        except Exception as e:
+            if len(lote) == 1:
+                return [(lote[0][0], None, e)]
+            return [r for semana in lote for r in self.save_weeks([semana])]
+        for (label, safe, _), huella in zip(lote, huellas):
+            storage._run_save_hooks(label, safe, huella)
+        return [(label, f"{self.ruta}:{label}", None) for label, _, _ in lote]
+
+    def _guardar(self, safe: dict, label: str) -> str:
+        """Guarda un plan ya serializable (salida de _to_json_safe o de storage.load_week)."""
+        with self._lock, self._con:
+            huella = self._insertar_semana(self._con.cursor(), safe, label)
+        storage._run_save_hooks(label, safe, huella)
+        return f"{self.ruta}:{label}"
+
+    def _insertar_semana(self, cur: sqlite3.Cursor, safe: dict, label: str) -> str:
+        """Sustituye la semana dentro de la transacción en curso; devuelve su huella."""
+        lunes = _lunes(label)
+        huella = hashlib.sha1(_json(safe).encode("utf-8")).hexdigest()
+        cabecera = {"orden": list(safe), "extra": {k: v for k, v in safe.items() if not storage._is_day(v)}}
+        cur.execute("DELETE FROM semanas WHERE label = ?", (label,))
+        cur.execute("INSERT INTO semanas (label, lunes, guardado, huella, cabecera) VALUES (?, ?, ?, ?, ?)",
+                    (label, lunes.isoformat() if lunes else None,
+                     datetime.now().isoformat(timespec="seconds"), huella, _json(cabecera)))
+        pos_dia = 0
+        for dia, datos in safe.items():
+            if not storage._is_day(datos):
+                continue
+            if dia in DIAS and lunes is not None:
+                fecha = (lunes + timedelta(days=DIAS.index(dia))).isoformat()
+            else:
+                fecha = datos.get("fecha_iso")
+            titulo = (datos.get("meta") or {}).get("titulo", "")
+            cur.execute("INSERT INTO dias (semana, dia, pos, fecha, titulo, datos) VALUES (?, ?, ?, ?, ?, ?)",
+                        (label, dia, pos_dia, fecha, titulo, _json({**datos, "bloques": None})))
+            pos_dia += 1
+            for pos_bloque, bloque in enumerate(datos.get("bloques") or []):
+                self._insertar_bloque(cur, label, dia, pos_bloque, bloque)
+        return huella
+
+    def _insertar_bloque(self, cur: sqlite3.Cursor, label: str, dia: str, pos: int, bloque: Any) -> None:
+        items = bloque.get("items") if isinstance(bloque, dict) else None
+        separar = isinstance(bloque, dict) and "items" in bloque and _normalizables(items)
+        datos = {**bloque, "items": None} if separar else bloque
+        tipo = bloque.get("tipo") if isinstance(bloque, dict) else None
+        cur.execute("INSERT INTO bloques (semana, dia, pos, tipo, items_aparte, datos) VALUES (?, ?, ?, ?, ?, ?)",
+                    (label, dia, pos, _texto(tipo), int(separar), _json(datos)))
+        if not separar:
+            return
+        bloque_id = cur.lastrowid
+        cur.executemany(
+            "INSERT INTO items (bloque, pos, ejercicio_id, ejercicio, ejercicio_norm, categoria, tipo_ejercicio,"
+            " series, repeticiones, rpe, superserie, datos) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(bloque_id, i, _entero(r.get("id")), _texto(r.get("ejercicio")),
+              _texto(r.get("ejercicio")).strip().lower() if r.get("ejercicio") is not None else None,
+              _texto(r.get("categoria")), _texto(r.get("tipo_ejercicio")), _texto(r.get("series")),
+              _texto(r.get("repeticiones")), _texto(r.get("RPE", r.get("rpe"))), _texto(r.get("superserie")),
+              _json(r))
+             for i, r in enumerate(items)])
+        nombres = {str(r["ejercicio"]).strip().lower() for r in items if r.get("ejercicio") is not None}
+        cur.executemany("INSERT OR IGNORE INTO ejercicios (norm) VALUES (?)", [(n,) for n in nombres])
+
+    # ---------------- lectura ----------------
+
+    def _dias(self, label: str, dia: Optional[str] = None) -> Dict[str, dict]:
+        filtro, params = ("AND dia = ?", (label, dia)) if dia is not None else ("", (label,))
+        dias = {d: json.loads(datos) for d, datos in self._con.execute(
+            f"SELECT dia, datos FROM dias WHERE semana = ? {filtro} ORDER BY pos", params)}
+        for d in dias.values():
+            d["bloques"] = []
+        ids = {}
+        for bid, d, aparte, datos in self._con.execute(
+                f"SELECT id, dia, items_aparte, datos FROM bloques WHERE semana = ? {filtro} ORDER BY dia, pos", params):
+            bloque = json.loads(datos)
+            dias[d]["bloques"].append(bloque)
+            if aparte:
+                bloque["items"] = []
+                ids[bid] = bloque
+        if ids:
+            marcas = ",".join("?" * len(ids))
+            for bid, datos in self._con.execute(
+                    f"SELECT bloque, datos FROM items WHERE bloque IN ({marcas}) ORDER BY bloque, pos", list(ids)):
+                ids[bid]["items"].append(json.loads(datos))
+        return dias
+
+    def _cabecera(self, label: str) -> dict:
+        fila = self._con.execute("SELECT cabecera FROM semanas WHERE label = ?", (label,)).fetchone()
+        if fila is None:
+            raise KeyError(f"semana no guardada: {label}")
+        return json.loads(fila[0])
+
+    def load_week(self, label: str) -> dict:
+        with self._lock:
+            cabecera = self._cabecera(label)
+            dias = self._dias(label)
+        return {k: dias[k] if k in dias else cabecera["extra"][k] for k in cabecera["orden"]}
+
+    def load_day(self, label: str, dia: str) -> dict:
+        with self._lock:
+            self._cabecera(label)
+            return self._dias(label, dia).get(dia, {})
+
+    def load_week_index(self, label: str) -> Dict[str, str]:
+        with self._lock:
+            self._cabecera(label)
+            return dict(self._con.execute(
+                "SELECT dia, titulo FROM dias WHERE semana = ? ORDER BY pos", (label,)).fetchall())
+
+    def list_weeks(self) -> List[str]:
+        with self._lock:
+            return [l for (l,) in self._con.execute("SELECT label FROM semanas ORDER BY label DESC")]
+
+    def fingerprints(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._con.execute("SELECT label, huella FROM semanas").fetchall())
+
+    def marca(self) -> int:
+        """Cambia cuando otra conexión (otro proceso) confirma cambios en la base de datos."""
+        with self._lock:
+            return self._con.execute("PRAGMA data_version").fetchone()[0]
+
+    # ---------------- consultas ----------------
+
+    def weeks_between(self, desde: date, hasta: date) -> List[str]:
+        """Semanas cuyo lunes cae en [desde, hasta]."""
+        with self._lock:
+            return [l for (l,) in self._con.execute(
+                "SELECT label FROM semanas WHERE lunes BETWEEN ? AND ? ORDER BY lunes, label",
+                (desde.isoformat(), hasta.isoformat()))]
+
+    def _filtro_ejercicio(self, texto: str) -> Tuple[str, tuple]:
+        """Condición sobre items 'i' para "el nombre contiene 'texto'" que usa ix_items_ejercicio.
+
+        Primero se buscan los nombres distintos que lo contienen (FTS trigram si hay 3+
+        caracteres; si no, recorriendo ejercicios) y después los items con esos nombres.
+        """
+        t = texto.strip().lower()
+        if self._fts and len(t) >= 3:
+            nombres = ("SELECT norm FROM ejercicios WHERE rowid IN"
+                       " (SELECT rowid FROM ejercicios_fts WHERE ejercicios_fts MATCH ?)")
+            return f"i.ejercicio_norm IN ({nombres})", ('"' + t.replace('"', '""') + '"',)
+        return "i.ejercicio_norm IN (SELECT norm FROM ejercicios WHERE instr(norm, ?) > 0)", (t,)
+
+    def weeks_with_exercise(self, texto: str) -> List[str]:
+        """Semanas que prescriben algún ejercicio cuyo nombre contiene 'texto' (sin mayúsculas)."""
+        filtro, params = self._filtro_ejercicio(texto)
+        with self._lock:
+            return [l for (l,) in self._con.execute(
+                "SELECT DISTINCT b.semana FROM items i JOIN bloques b ON b.id = i.bloque"
+                f" WHERE {filtro} ORDER BY b.semana", params)]
+
+    def days_with_exercise(self, texto: str) -> List[Tuple[str, str, Optional[str]]]:
+        """[(label, dia, fecha)] de los días que incluyen el ejercicio."""
+        filtro, params = self._filtro_ejercicio(texto)
+        with self._lock:
+            return self._con.execute(
+                "SELECT DISTINCT b.semana, b.dia, d.fecha FROM items i"
+                " JOIN bloques b ON b.id = i.bloque"
+                " JOIN dias d ON d.semana = b.semana AND d.dia = b.dia"
+                f" WHERE {filtro} ORDER BY b.semana, d.pos", params).fetchall()
+
+# ---------------- Migración desde planes/ ----------------
+
+def migrar_desde_archivos(backend: SQLiteBackend, base_dir: Optional[str] = None) -> Tuple[int, List[Tuple[str, str]]]:
+    """Copia todas las semanas del backend de archivos al SQLite y comprueba que se leen igual.
+
+    Devuelve (semanas migradas, [(label, error)]).
+    """
+    anterior = storage.BASE_DIR
+    if base_dir is not None:
+        storage.BASE_DIR = os.path.abspath(base_dir)
+    try:
+        migradas, fallos = 0, []
+        for label in storage.list_weeks():
+            try:
+                plan = storage.load_week(label)        # ya es JSON: se guarda tal cual
+                backend._guardar(plan, label)
+                if _json(backend.load_week(label)) != _json(plan):   # como texto: NaN == NaN
+                    raise ValueError("la semana migrada no coincide con el original")
+                migradas += 1
+            except Exception as e:
+                fallos.append((label, f"{type(e).__name__}: {e}"))
+        return migradas, fallos
+    finally:
+        storage.BASE_DIR = anterior
+
+def main():
+    ap = argparse.ArgumentParser(description="Migra las semanas de planes/ a una base SQLite")
+    ap.add_argument("--db", default="planes.db")
+    ap.add_argument("--planes", default=storage.BASE_DIR, help="directorio con plan_*.json / plan_*.planz")
+    args = ap.parse_args()
+
+    backend = SQLiteBackend(args.db)
+    migradas, fallos = migrar_desde_archivos(backend, args.planes)
+    print(f"Migradas {migradas} semanas a {args.db}")
+    for label, error in fallos:
+        print(f"  ✗ {label}: {error}")
+    backend.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# test_planner.py – sorteo reproducible del planner (pytest)
+import copy
+
+import pandas as pd
+import pytest
+
+import planner
+
+TIPOS = ["Compuesto", "Accesorio", "Movilidad"]
+
+@pytest.fixture(scope="module")
+def catalogo() -> pd.DataFrame:
+    n = 90
+    return pd.DataFrame({
+        "ejercicio": [f"Ejercicio {i}" for i in range(n)],
+        "tipo_ejercicio": [TIPOS[i % 3] for i in range(n)],
+        "categoria": ["Torso" if i % 2 else "Pierna" for i in range(n)],
+        "subcategoria": ["General"] * n,
+        "prioridad": [1 + i % 2 for i in range(n)],
+    })
+
+def _plantilla(*bloques):
+    return {"meta": {"titulo": "Prueba"}, "orden": [b for b, _ in bloques], "reglas": dict(bloques)}
+
+PATTERNS = {
+    "Lunes": _plantilla(("Pesado", {"tipo_ejercicio": "Compuesto", "n": 3}),
+                        ("Accesorios", {"tipo_ejercicio": "Accesorio", "n": 4})),
+    "Miércoles": _plantilla(("Pesado", {"tipo_ejercicio": "Compuesto", "n": 3}),
+                            ("Movilidad", {"tipo_ejercicio": "Movilidad", "n": 2})),
+    "Viernes": _plantilla(("Accesorios", {"tipo_ejercicio": "Accesorio", "prioridad": 2, "n": 5})),
+}
+
+def _ejercicios(sesion):
+    return [list(b["items"]["ejercicio"]) for b in sesion["bloques"]]
+
+def test_misma_semilla_mismo_plan(catalogo):
+    a = planner.plan_semana(catalogo, PATTERNS, atleta="ana")
+    b = planner.plan_semana(catalogo, PATTERNS, atleta="ana")
+    assert {d: _ejercicios(s) for d, s in a.items() if s["bloques"]} == \
+           {d: _ejercicios(s) for d, s in b.items() if s["bloques"]}
+
+def test_plan_dia_igual_que_en_la_semana(catalogo):
+    semana = planner.plan_semana(catalogo, PATTERNS, semana_mesociclo=2, atleta="ana")
+    for dia in PATTERNS:
+        solo = planner.plan_dia(catalogo, PATTERNS, dia, semana_mesociclo=2, atleta="ana")
+        assert _ejercicios(solo) == _ejercicios(semana[dia])
+
+def test_editar_un_bloque_no_cambia_los_demas(catalogo):
+    editado = copy.deepcopy(PATTERNS)
+    # menos candidatos y más ejercicios: con un solo flujo para la semana cambiaría todo lo posterior
+    editado["Lunes"]["reglas"]["Accesorios"].update(prioridad=1, n=6)
+    antes = planner.plan_semana(catalogo, PATTERNS, atleta="ana")
+    despues = planner.plan_semana(catalogo, editado, atleta="ana")
+    assert len(despues["Lunes"]["bloques"][1]["items"]) == 6
+    # el otro bloque del día y los demás días no cambian
+    assert _ejercicios(despues["Lunes"])[0] == _ejercicios(antes["Lunes"])[0]
+    for dia in ("Miércoles", "Viernes"):
+        assert _ejercicios(despues[dia]) == _ejercicios(antes[dia])
+
+def test_plan_dia_con_clave_que_no_es_un_dia(catalogo):
+    patterns = {**PATTERNS, "Extra": _plantilla(("Movilidad", {"tipo_ejercicio": "Movilidad", "n": 2}))}
+    ses = planner.plan_dia(catalogo, patterns, "Extra", atleta="ana")
+    assert ses["meta"] == {"titulo": "Prueba"}
+    assert len(ses["bloques"][0]["items"]) == 2
+    assert set(ses["bloques"][0]["items"]["tipo_ejercicio"]) == {"Movilidad"}
+    # no altera la semana ni aparece al recorrerla
+    semana = planner.PlanSemana(catalogo, patterns, atleta="ana")
+    assert list(semana) == planner.DIAS
+    assert _ejercicios(semana["Lunes"]) == _ejercicios(planner.plan_dia(catalogo, PATTERNS, "Lunes", atleta="ana"))